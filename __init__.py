@@ -3,10 +3,12 @@ from .surgical_agent import SurgicalPlanningAgent
 from .chronic_care_agent import ChronicCareAgent
 from .risk_assessment_agent import RiskAssessmentAgent
 from .safety_contraindication_agent import SafetyContraindicationAgent
+from .combined_analysis import CombinedClinicalAgent
 
 __all__ = [
     "SurgicalPlanningAgent",
     "ChronicCareAgent",
     "RiskAssessmentAgent",
-    "SafetyContraindicationAgent"
+    "SafetyContraindicationAgent",
+    "CombinedClinicalAgent"
 ]
@@ -1,128 +1,391 @@
-"""
-Chronic Care Management Agent
-"""
-import logging
-from typing import Dict, Any
-from services.gemini_client import GeminiClient
-from utils.json_guard import safe_get
-
-logger = logging.getLogger(__name__)
-
-
-class ChronicCareAgent:
-    """
-    Agent responsible for long-term chronic disease management analysis.
-    """
-    
-    def __init__(self, gemini_client: GeminiClient):
-        """
-        Initialize Chronic Care Agent.
-        
-        Args:
-            gemini_client: Configured Gemini client instance
-        """
-        self.gemini = gemini_client
-        self.agent_name = "Chronic Care Agent"
-    
-    def analyze(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        simulation_horizon: int
-    ) -> Dict[str, Any]:
-        """
-        Analyze long-term chronic care impact of treatment.
-        
-        Args:
-            patient_summary: Patient clinical summary
-            treatment_option: Treatment to analyze
-            simulation_horizon: Days to simulate
-        
-        Returns:
-            Chronic care analysis results
-        """
-        logger.info(f"{self.agent_name}: Analyzing treatment: {treatment_option}")
-        
-        prompt = self._build_prompt(patient_summary, treatment_option, simulation_horizon)
-        
-        response = self.gemini.generate_json_response(
-            prompt=prompt,
-            system_instruction="You are a chronic disease management expert AI assistant."
-        )
-        
-        # Handle error responses
-        if safe_get(response, "error"):
-            logger.error(f"{self.agent_name}: {response.get('error')}")
-            return self._create_fallback_response(treatment_option, error=True)
-        
-        # Validate required fields
-        required_fields = [
-            "long_term_management",
-            "medication_burden_score",
-            "lifestyle_impact",
-            "disease_stability",
-            "follow_up_frequency",
-            "insights"
-        ]
-        
-        if all(field in response for field in required_fields):
-            logger.info(f"{self.agent_name}: Analysis completed successfully")
-            return response
-        
-        logger.warning(f"{self.agent_name}: Incomplete response, using fallback")
-        return self._create_fallback_response(treatment_option)
-    
-    def _build_prompt(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        simulation_horizon: int
-    ) -> str:
-        """Build analysis prompt."""
-        return f"""
-You are a chronic disease management expert. Analyze the long-term care implications of the following treatment.
-
-PATIENT SUMMARY:
-{patient_summary}
-
-TREATMENT OPTION:
-{treatment_option}
-
-SIMULATION HORIZON: {simulation_horizon} days
-
-Provide a detailed chronic care analysis with the following JSON structure:
-
-{{
-  "long_term_management": "<description of ongoing care requirements>",
-  "medication_burden_score": <float 0-10, where 10 is highest burden>,
-  "lifestyle_impact": "<minimal/moderate/significant/severe>",
-  "disease_stability": "<excellent/good/fair/poor>",
-  "follow_up_frequency": "<daily/weekly/monthly/quarterly>",
-  "insights": "<detailed explanation of long-term management considerations, quality of life impact, and sustainability>"
-}}
-
-Consider:
-- Number and complexity of medications required
-- Frequency of monitoring and follow-up visits
-- Impact on daily activities and quality of life
-- Disease progression control
-- Patient adherence challenges
-- Caregiver burden
-
-Respond ONLY with valid JSON.
-"""
-    
-    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
-        """Create fallback response when Gemini fails."""
-        return {
-            "long_term_management": "Unknown - requires evaluation" if error else "Standard chronic care protocol",
-            "medication_burden_score": 0.0 if error else 5.0,
-            "lifestyle_impact": "unknown" if error else "moderate",
-            "disease_stability": "unknown" if error else "fair",
-            "follow_up_frequency": "unknown" if error else "monthly",
-            "insights": (
-                f"Error analyzing chronic care impact for {treatment}. Manual review required."
-                if error
-                else f"Standard chronic care considerations for {treatment}. Further evaluation recommended."
-            )
-        }
+"""
+Chronic Care Management Agent
+"""
+import asyncio
+import logging
+from typing import Dict, Any, List
+
+import fastjsonschema
+
+from services.gemini_client import GeminiClient
+from utils.json_guard import safe_get
+from utils.response_cache import make_cache_key, cache_get, cache_put, coalesce
+from utils.semantic_cache import semantic_get, semantic_put
+
+logger = logging.getLogger(__name__)
+
+# Static prompt scaffolding, hoisted to module constants so analyze() only
+# assembles the small dynamic tail per call and the cacheable prefix stays
+# byte-identical. Output structure is enforced by the response schema below,
+# so the prompt only carries the clinical guidance.
+_PROMPT_SCAFFOLD = """You are a chronic disease management expert. Analyze the long-term care implications of a proposed treatment.
+
+Report:
+- long_term_management: description of ongoing care requirements
+- medication_burden_score: 0-10, where 10 is highest burden
+- lifestyle_impact: minimal/moderate/significant/severe
+- disease_stability: excellent/good/fair/poor
+- follow_up_frequency: daily/weekly/monthly/quarterly
+- insights: detailed explanation of long-term management considerations, quality of life impact, and sustainability
+
+Consider:
+- Number and complexity of medications required
+- Frequency of monitoring and follow-up visits
+- Impact on daily activities and quality of life
+- Disease progression control
+- Patient adherence challenges
+- Caregiver burden
+
+Analyze the patient and treatment described below.
+"""
+
+_BATCH_PROMPT_SCAFFOLD = """You are a chronic disease management expert. Analyze the long-term care implications of EACH of the proposed treatments independently, producing one entry in "results" per treatment, in the same order the treatments are listed.
+
+For each treatment report:
+- long_term_management: description of ongoing care requirements
+- medication_burden_score: 0-10, where 10 is highest burden
+- lifestyle_impact: minimal/moderate/significant/severe
+- disease_stability: excellent/good/fair/poor
+- follow_up_frequency: daily/weekly/monthly/quarterly
+- insights: detailed explanation of long-term management considerations, quality of life impact, and sustainability
+
+Consider:
+- Number and complexity of medications required
+- Frequency of monitoring and follow-up visits
+- Impact on daily activities and quality of life
+- Disease progression control
+- Patient adherence challenges
+- Caregiver burden
+
+Analyze the patient and treatments described below.
+"""
+
+# Gemini structured-output schema (OpenAPI subset, REST casing); the model
+# is forced to emit JSON matching this shape
+_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "long_term_management": {"type": "STRING"},
+        "medication_burden_score": {"type": "NUMBER"},
+        "lifestyle_impact": {
+            "type": "STRING",
+            "enum": ["minimal", "moderate", "significant", "severe"]
+        },
+        "disease_stability": {
+            "type": "STRING",
+            "enum": ["excellent", "good", "fair", "poor"]
+        },
+        "follow_up_frequency": {
+            "type": "STRING",
+            "enum": ["daily", "weekly", "monthly", "quarterly"]
+        },
+        "insights": {"type": "STRING"}
+    },
+    "required": [
+        "long_term_management",
+        "medication_burden_score",
+        "lifestyle_impact",
+        "disease_stability",
+        "follow_up_frequency",
+        "insights"
+    ]
+}
+
+_BATCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "results": {
+            "type": "ARRAY",
+            "items": _RESPONSE_SCHEMA
+        }
+    },
+    "required": ["results"]
+}
+
+
+class ChronicCareAgent:
+    """
+    Agent responsible for long-term chronic disease management analysis.
+    """
+
+    # Fixed attribute layout: skips the per-instance __dict__ and makes
+    # attribute access a slot lookup on the agent hot path
+    __slots__ = ("gemini", "agent_name", "_cached_content", "_cached_batch_content")
+
+    REQUIRED_FIELDS = [
+        "long_term_management",
+        "medication_burden_score",
+        "lifestyle_impact",
+        "disease_stability",
+        "follow_up_frequency",
+        "insights"
+    ]
+
+    # Largest number of treatments analyzed in one Gemini call; bigger
+    # batches are split so latency stays on the flat part of the curve
+    MAX_BATCH = 8
+
+    # Frozenset view for C-level subset checks on the batch hot path
+    _REQUIRED = frozenset(REQUIRED_FIELDS)
+
+    # Compiled once at class definition; validates types and value ranges
+    # in addition to field presence
+    _VALIDATE = staticmethod(fastjsonschema.compile({
+        "type": "object",
+        "required": REQUIRED_FIELDS,
+        "properties": {
+            "long_term_management": {"type": "string"},
+            "medication_burden_score": {"type": "number", "minimum": 0, "maximum": 10},
+            "lifestyle_impact": {"enum": ["minimal", "moderate", "significant", "severe"]},
+            "disease_stability": {"enum": ["excellent", "good", "fair", "poor"]},
+            "follow_up_frequency": {"enum": ["daily", "weekly", "monthly", "quarterly"]},
+            "insights": {"type": "string"}
+        }
+    }))
+    
+    def __init__(self, gemini_client: GeminiClient):
+        """
+        Initialize Chronic Care Agent.
+        
+        Args:
+            gemini_client: Configured Gemini client instance
+        """
+        self.gemini = gemini_client
+        self.agent_name = "Chronic Care Agent"
+        self._cached_content = None
+        self._cached_batch_content = None
+
+    async def init_prompt_cache(self) -> None:
+        """
+        Cache the static prompt scaffolding server-side.
+
+        Called once at startup; when the caches exist, analyze() and
+        analyze_batch() only send the dynamic patient/treatment tail per call.
+        """
+        self._cached_content = await self.gemini.create_cached_content(
+            content_text=self._scaffold(),
+            system_instruction="You are a chronic disease management expert AI assistant."
+        )
+        self._cached_batch_content = await self.gemini.create_cached_content(
+            content_text=self._batch_scaffold(),
+            system_instruction="You are a chronic disease management expert AI assistant."
+        )
+        if self._cached_content or self._cached_batch_content:
+            logger.info("%s: Prompt scaffold cached", self.agent_name)
+
+
+    async def analyze(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int
+    ) -> Dict[str, Any]:
+        """
+        Analyze long-term chronic care impact of treatment.
+        
+        Args:
+            patient_summary: Patient clinical summary
+            treatment_option: Treatment to analyze
+            simulation_horizon: Days to simulate
+        
+        Returns:
+            Chronic care analysis results
+        """
+        logger.info("%s: Analyzing treatment: %s", self.agent_name, treatment_option)
+
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, treatment_option, simulation_horizon
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        semantic_text = f"{patient_summary}\n{treatment_option}\nhorizon={simulation_horizon}"
+        # Namespace by call shape: single and batch responses have
+        # different types, and the shared patient summary dominates the
+        # embedding enough for the two to cross-hit otherwise
+        semantic_namespace = f"{self.agent_name}:single"
+        semantic_hit = semantic_get(semantic_namespace, semantic_text)
+        if semantic_hit is not None:
+            return semantic_hit
+
+        prompt = self._build_prompt(patient_summary, treatment_option, simulation_horizon)
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a chronic disease management expert AI assistant.",
+            cached_content=self._cached_content,
+            response_schema=_RESPONSE_SCHEMA
+        ))
+        
+        # Handle error responses
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return self._create_fallback_response(treatment_option, error=True)
+        
+        # Validate against the compiled schema
+        try:
+            self._VALIDATE(response)
+        except fastjsonschema.JsonSchemaException as e:
+            logger.warning("%s: Invalid response (%s), using fallback", self.agent_name, e.message)
+            return self._create_fallback_response(treatment_option)
+
+        logger.info("%s: Analysis completed successfully", self.agent_name)
+        cache_put(cache_key, response)
+        semantic_put(semantic_namespace, semantic_text, response)
+        return response
+
+    async def analyze_batch(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        simulation_horizon: int,
+        patient_cache: str = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyze several treatments in a single Gemini call.
+
+        Amortizes the shared prompt prefix and one network round-trip
+        across all treatments instead of paying them per treatment.
+
+        Args:
+            patient_summary: Patient clinical summary
+            treatments: Treatment options to analyze
+            simulation_horizon: Days to simulate
+            patient_cache: Optional cachedContents resource holding the
+                patient summary, shared across all agents in one request
+
+        Returns:
+            One analysis result per treatment, in input order
+        """
+        logger.info("%s: Batch analyzing %d treatments", self.agent_name, len(treatments))
+
+        if len(treatments) > self.MAX_BATCH:
+            # Split oversized batches and run the chunks concurrently
+            chunk_results = await asyncio.gather(*(
+                self.analyze_batch(
+                    patient_summary,
+                    treatments[i:i + self.MAX_BATCH],
+                    simulation_horizon,
+                    patient_cache=patient_cache
+                )
+                for i in range(0, len(treatments), self.MAX_BATCH)
+            ))
+            return [entry for chunk in chunk_results for entry in chunk]
+
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, tuple(treatments), simulation_horizon
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        semantic_text = "\n".join([patient_summary, *treatments, f"horizon={simulation_horizon}"])
+        # Namespaced by shape and size so a hit always carries one entry
+        # per requested treatment (see the single-call path)
+        semantic_namespace = f"{self.agent_name}:batch:{len(treatments)}"
+        semantic_hit = semantic_get(semantic_namespace, semantic_text)
+        if semantic_hit is not None:
+            return semantic_hit
+
+        prompt = self._build_batch_prompt(
+            patient_summary, treatments, simulation_horizon,
+            patient_cached=bool(patient_cache)
+        )
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a chronic disease management expert AI assistant.",
+            cached_content=patient_cache or self._cached_batch_content,
+            response_schema=_BATCH_RESPONSE_SCHEMA
+        ))
+
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return [
+                self._create_fallback_response(t, error=True) for t in treatments
+            ]
+
+        results = response.get("results")
+        if not isinstance(results, list) or len(results) != len(treatments):
+            logger.warning("%s: Malformed batch response, using fallbacks", self.agent_name)
+            return [self._create_fallback_response(t) for t in treatments]
+
+        validated = []
+        used_fallback = False
+        for treatment, entry in zip(treatments, results):
+            if isinstance(entry, dict) and entry.keys() >= self._REQUIRED:
+                validated.append(entry)
+            else:
+                logger.warning("%s: Incomplete batch entry, using fallback", self.agent_name)
+                validated.append(self._create_fallback_response(treatment))
+                used_fallback = True
+
+        logger.info("%s: Batch analysis completed successfully", self.agent_name)
+        if not used_fallback:
+            cache_put(cache_key, validated)
+            semantic_put(semantic_namespace, semantic_text, validated)
+        return validated
+
+    def _scaffold(self) -> str:
+        """Static prompt scaffolding (module constant, cacheable prefix)."""
+        return _PROMPT_SCAFFOLD
+
+    def _build_prompt(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int
+    ) -> str:
+        """Build analysis prompt (dynamic tail only when the scaffold is cached)."""
+        dynamic = "".join((
+            "\nPATIENT SUMMARY:\n", patient_summary,
+            "\n\nTREATMENT OPTION:\n", treatment_option,
+            "\n\nSIMULATION HORIZON: ", str(simulation_horizon), " days\n"
+        ))
+        if self._cached_content:
+            return dynamic
+        return _PROMPT_SCAFFOLD + dynamic
+
+    def _batch_scaffold(self) -> str:
+        """Static batch prompt scaffolding (module constant, cacheable prefix)."""
+        return _BATCH_PROMPT_SCAFFOLD
+
+    def _build_batch_prompt(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        simulation_horizon: int,
+        patient_cached: bool = False
+    ) -> str:
+        """Build batch analysis prompt (dynamic tail only when the scaffold is cached)."""
+        treatment_lines = "\n".join(
+            f"{i}. {treatment}" for i, treatment in enumerate(treatments, start=1)
+        )
+        dynamic = "".join((
+            "" if patient_cached else f"\nPATIENT SUMMARY:\n{patient_summary}\n",
+            "\nTREATMENT OPTIONS:\n", treatment_lines,
+            "\n\nSIMULATION HORIZON: ", str(simulation_horizon), " days\n"
+        ))
+        if patient_cached:
+            # Only one cachedContents can be attached per call, and the
+            # patient summary cache wins; send the scaffold inline
+            return _BATCH_PROMPT_SCAFFOLD + dynamic
+        if self._cached_batch_content:
+            return dynamic
+        return _BATCH_PROMPT_SCAFFOLD + dynamic
+    
+    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
+        """Create fallback response when Gemini fails."""
+        return {
+            "long_term_management": "Unknown - requires evaluation" if error else "Standard chronic care protocol",
+            "medication_burden_score": 0.0 if error else 5.0,
+            "lifestyle_impact": "unknown" if error else "moderate",
+            "disease_stability": "unknown" if error else "fair",
+            "follow_up_frequency": "unknown" if error else "monthly",
+            "insights": (
+                f"Error analyzing chronic care impact for {treatment}. Manual review required."
+                if error
+                else f"Standard chronic care considerations for {treatment}. Further evaluation recommended."
+            )
+        }
@@ -0,0 +1,162 @@
+"""
+Combined Clinical Analysis Agent
+"""
+import logging
+from typing import Dict, Any
+
+from services.gemini_client import GeminiClient
+from utils.json_guard import safe_get
+from utils.response_cache import make_cache_key, cache_get, cache_put, coalesce
+from .surgical_agent import SurgicalPlanningAgent, _RESPONSE_SCHEMA as _SURGICAL_SCHEMA
+from .chronic_care_agent import ChronicCareAgent, _RESPONSE_SCHEMA as _CHRONIC_SCHEMA
+from .risk_assessment_agent import RiskAssessmentAgent, _RESPONSE_SCHEMA as _RISK_SCHEMA
+from .safety_contraindication_agent import (
+    SafetyContraindicationAgent,
+    _RESPONSE_SCHEMA as _SAFETY_SCHEMA
+)
+
+logger = logging.getLogger(__name__)
+
+# Static prompt scaffolding, hoisted to a module constant so the builder
+# only assembles the small dynamic tail per call. Per-expert output
+# structure is enforced by the combined response schema below, so the
+# prompt only carries the personae and their analysis focus.
+_PROMPT_SCAFFOLD = """You are a panel of four independent clinical experts jointly reviewing ONE proposed treatment for ONE patient. Produce all four assessments in a single JSON object with top-level keys "surgical", "chronic", "risk", and "safety".
+
+For each key, reason strictly in that expert's persona:
+- "surgical" - a surgical planning expert: feasibility, invasiveness, expected recovery, procedural complexity, anesthesia risk
+- "chronic" - a chronic disease management expert: long-term management, medication burden, lifestyle impact, disease stability, follow-up cadence
+- "risk" - a clinical risk assessment expert: complication probability, readmission risk, key risk factors, mitigation strategies, uncertainty
+- "safety" - a clinical safety expert who FLAGS contraindications, drug interactions, and warnings but does NOT override decisions
+
+Each expert reasons independently from the same patient and treatment information; do not let one persona's conclusions leak into another's.
+
+Analyze the patient and treatment described below.
+"""
+
+# The section schemas are the same ones each standalone agent enforces,
+# so a combined result is field-for-field interchangeable with four
+# individual agent results
+_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "surgical": _SURGICAL_SCHEMA,
+        "chronic": _CHRONIC_SCHEMA,
+        "risk": _RISK_SCHEMA,
+        "safety": _SAFETY_SCHEMA
+    },
+    "required": ["surgical", "chronic", "risk", "safety"]
+}
+
+
+class CombinedClinicalAgent:
+    """
+    Single-call alternative to the four standalone agents.
+
+    Sends one Gemini request asking for all four expert assessments at
+    once, trading the three extra round-trips (and three prompt prefixes)
+    of the fan-out flow for one larger response. The standalone agents
+    remain the default orchestration path; this agent suits flows that
+    analyze one treatment and want minimum wall-clock latency.
+    """
+
+    # Fixed attribute layout: skips the per-instance __dict__ and makes
+    # attribute access a slot lookup on the agent hot path
+    __slots__ = ("gemini", "agent_name", "_sections")
+
+    def __init__(self, gemini_client: GeminiClient):
+        """
+        Initialize Combined Clinical Agent.
+
+        Args:
+            gemini_client: Configured Gemini client instance
+        """
+        self.gemini = gemini_client
+        self.agent_name = "Combined Clinical Agent"
+        # Section helpers are reused for their required-field sets and
+        # fallback builders only; they never issue Gemini calls from here
+        self._sections = (
+            ("surgical", SurgicalPlanningAgent(gemini_client)),
+            ("chronic", ChronicCareAgent(gemini_client)),
+            ("risk", RiskAssessmentAgent(gemini_client)),
+            ("safety", SafetyContraindicationAgent(gemini_client))
+        )
+
+    async def analyze(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int = 30
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Run all four expert analyses in a single Gemini call.
+
+        Args:
+            patient_summary: Patient clinical summary
+            treatment_option: Treatment to analyze
+            simulation_horizon: Days to simulate
+
+        Returns:
+            Dictionary with "surgical", "chronic", "risk", and "safety"
+            sections, each shaped like the corresponding standalone
+            agent's result (fallbacks included on failure)
+        """
+        logger.info("%s: Analyzing treatment: %s", self.agent_name, treatment_option)
+
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, treatment_option, simulation_horizon
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        prompt = self._build_prompt(patient_summary, treatment_option, simulation_horizon)
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a multi-disciplinary clinical analysis panel AI assistant.",
+            response_schema=_RESPONSE_SCHEMA
+        ))
+
+        # Handle error responses
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return {
+                key: helper._create_fallback_response(treatment_option, error=True)
+                for key, helper in self._sections
+            }
+
+        # Validate each section against its agent's required fields,
+        # falling back per section so one malformed expert doesn't
+        # discard the other three
+        result: Dict[str, Dict[str, Any]] = {}
+        used_fallback = False
+        for key, helper in self._sections:
+            entry = response.get(key)
+            if isinstance(entry, dict) and entry.keys() >= helper._REQUIRED:
+                result[key] = entry
+            else:
+                logger.warning(
+                    "%s: Incomplete %s section, using fallback", self.agent_name, key
+                )
+                result[key] = helper._create_fallback_response(treatment_option)
+                used_fallback = True
+
+        logger.info("%s: Analysis completed successfully", self.agent_name)
+        if not used_fallback:
+            cache_put(cache_key, result)
+        return result
+
+    def _build_prompt(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int
+    ) -> str:
+        """Build analysis prompt (static scaffold plus small dynamic tail)."""
+        return "".join((
+            _PROMPT_SCAFFOLD,
+            "\nPATIENT SUMMARY:\n", patient_summary,
+            "\n\nTREATMENT OPTION:\n", treatment_option,
+            "\n\nSIMULATION HORIZON: ", str(simulation_horizon), " days\n"
+        ))
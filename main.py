@@ -1,450 +1,741 @@
-"""
-FastAPI Medical Decision Support System
-Multi-Agent Orchestration Backend
-"""
-import os
-import logging
-from datetime import datetime
-from typing import Dict, Any
-from contextlib import asynccontextmanager
-from dotenv import load_dotenv
-
-from fastapi import FastAPI, HTTPException, status
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-
-from models import (
-    SimulationRequest,
-    SimulationResponse,
-    HealthResponse,
-    ErrorResponse
-)
-from services import GeminiClient
-from agents import (
-    SurgicalPlanningAgent,
-    ChronicCareAgent,
-    RiskAssessmentAgent,
-    SafetyContraindicationAgent
-)
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-# Global instances
-gemini_client: GeminiClient = None
-surgical_agent: SurgicalPlanningAgent = None
-chronic_care_agent: ChronicCareAgent = None
-risk_agent: RiskAssessmentAgent = None
-safety_agent: SafetyContraindicationAgent = None
-
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    """Application lifespan manager - startup and shutdown"""
-    global gemini_client, surgical_agent, chronic_care_agent, risk_agent, safety_agent
-    
-    # Startup
-    logger.info("🚀 Starting Medical Decision Support System...")
-    
-    try:
-        # Initialize Gemini client
-        gemini_client = GeminiClient()
-        logger.info("✓ Gemini client initialized")
-        
-        # Initialize all agents
-        surgical_agent = SurgicalPlanningAgent(gemini_client)
-        chronic_care_agent = ChronicCareAgent(gemini_client)
-        risk_agent = RiskAssessmentAgent(gemini_client)
-        safety_agent = SafetyContraindicationAgent(gemini_client)
-        
-        logger.info("✓ All agents initialized successfully")
-        logger.info("🎯 System ready to accept requests")
-        
-    except Exception as e:
-        logger.error(f"❌ Failed to initialize system: {str(e)}")
-        raise
-    
-    yield
-    
-    # Shutdown
-    logger.info("🛑 Shutting down Medical Decision Support System...")
-
-
-# Create FastAPI app
-app = FastAPI(
-    title="Medical Decision Support API",
-    description="Multi-Agent Medical Decision Support System using Gemini AI",
-    version="1.0.0",
-    lifespan=lifespan
-)
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify exact origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-@app.get("/", tags=["Root"])
-async def root():
-    """Root endpoint"""
-    return {
-        "message": "Medical Decision Support API",
-        "version": "1.0.0",
-        "status": "operational",
-        "endpoints": {
-            "health": "/health",
-            "simulate": "/simulate (POST)",
-            "docs": "/docs"
-        }
-    }
-
-
-@app.get("/health", response_model=HealthResponse, tags=["Health"])
-async def health_check():
-    """
-    Health check endpoint to verify system status.
-    
-    Returns:
-        HealthResponse with system status
-    """
-    try:
-        # Check if agents are initialized
-        if not all([surgical_agent, chronic_care_agent, risk_agent, safety_agent]):
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Agents not initialized"
-            )
-        
-        # Check Gemini connectivity
-        gemini_healthy = gemini_client.check_health()
-        
-        if not gemini_healthy:
-            logger.warning("Gemini API health check failed")
-        
-        return HealthResponse(
-            status="healthy" if gemini_healthy else "degraded",
-            message="All systems operational" if gemini_healthy else "Gemini API connectivity issues",
-            timestamp=datetime.now().isoformat()
-        )
-    
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail=f"Health check failed: {str(e)}"
-        )
-
-
-@app.post("/simulate", response_model=SimulationResponse, tags=["Simulation"])
-async def simulate_treatment(request: SimulationRequest):
-    """
-    Run multi-agent medical decision support simulation.
-    
-    Args:
-        request: SimulationRequest with patient data and treatment options
-    
-    Returns:
-        SimulationResponse with agent outputs and comparison
-    """
-    logger.info(f"📋 New simulation request received")
-    logger.info(f"   Patient: {request.patient_summary[:100]}...")
-    logger.info(f"   Treatment A: {request.treatment_a}")
-    logger.info(f"   Treatment B: {request.treatment_b}")
-    logger.info(f"   Horizon: {request.simulation_horizon} days")
-    
-    try:
-        # Orchestrate multi-agent analysis
-        result = await orchestrate_agents(
-            patient_summary=request.patient_summary,
-            treatment_a=request.treatment_a,
-            treatment_b=request.treatment_b,
-            simulation_horizon=request.simulation_horizon
-        )
-        
-        logger.info("✅ Simulation completed successfully")
-        return result
-    
-    except Exception as e:
-        logger.error(f"❌ Simulation failed: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Simulation failed: {str(e)}"
-        )
-
-
-async def orchestrate_agents(
-    patient_summary: str,
-    treatment_a: str,
-    treatment_b: str,
-    simulation_horizon: int
-) -> SimulationResponse:
-    """
-    Orchestrate all agents to analyze both treatment options.
-    
-    Args:
-        patient_summary: Patient clinical summary
-        treatment_a: First treatment option
-        treatment_b: Second treatment option
-        simulation_horizon: Days to simulate
-    
-    Returns:
-        Complete simulation response
-    """
-    logger.info("🤖 Orchestrating multi-agent analysis...")
-    
-    # Analyze Treatment A
-    logger.info("🔍 Analyzing Treatment A...")
-    surgical_a = surgical_agent.analyze(patient_summary, treatment_a, simulation_horizon)
-    chronic_a = chronic_care_agent.analyze(patient_summary, treatment_a, simulation_horizon)
-    risk_a = risk_agent.analyze(patient_summary, treatment_a, simulation_horizon)
-    
-    # Pass Treatment A outputs to safety agent
-    safety_a = safety_agent.analyze(
-        patient_summary=patient_summary,
-        treatment_option=treatment_a,
-        other_agent_outputs={
-            "surgical_agent": surgical_a,
-            "chronic_care_agent": chronic_a,
-            "risk_agent": risk_a
-        }
-    )
-    
-    # Analyze Treatment B
-    logger.info("🔍 Analyzing Treatment B...")
-    surgical_b = surgical_agent.analyze(patient_summary, treatment_b, simulation_horizon)
-    chronic_b = chronic_care_agent.analyze(patient_summary, treatment_b, simulation_horizon)
-    risk_b = risk_agent.analyze(patient_summary, treatment_b, simulation_horizon)
-    
-    # Pass Treatment B outputs to safety agent
-    safety_b = safety_agent.analyze(
-        patient_summary=patient_summary,
-        treatment_option=treatment_b,
-        other_agent_outputs={
-            "surgical_agent": surgical_b,
-            "chronic_care_agent": chronic_b,
-            "risk_agent": risk_b
-        }
-    )
-    
-    # Generate comparison
-    logger.info("📊 Generating treatment comparison...")
-    comparison_a = generate_treatment_comparison(
-        surgical=surgical_a,
-        chronic=chronic_a,
-        risk=risk_a,
-        safety=safety_a,
-        treatment_name=treatment_a,
-        priority=1
-    )
-    
-    comparison_b = generate_treatment_comparison(
-        surgical=surgical_b,
-        chronic=chronic_b,
-        risk=risk_b,
-        safety=safety_b,
-        treatment_name=treatment_b,
-        priority=2
-    )
-    
-    # Generate final notes
-    final_notes = generate_final_notes(
-        treatment_a=treatment_a,
-        treatment_b=treatment_b,
-        comparison_a=comparison_a,
-        comparison_b=comparison_b,
-        safety_a=safety_a,
-        safety_b=safety_b
-    )
-    
-    return SimulationResponse(
-        agents={
-            "surgical_agent": {
-                "treatment_a": surgical_a,
-                "treatment_b": surgical_b
-            },
-            "chronic_care_agent": {
-                "treatment_a": chronic_a,
-                "treatment_b": chronic_b
-            },
-            "risk_agent": {
-                "treatment_a": risk_a,
-                "treatment_b": risk_b
-            },
-            "safety_agent": {
-                "treatment_a": safety_a,
-                "treatment_b": safety_b
-            }
-        },
-        comparison={
-            "treatment_a": comparison_a,
-            "treatment_b": comparison_b
-        },
-        final_notes=final_notes
-    )
-
-
-def generate_treatment_comparison(
-    surgical: Dict[str, Any],
-    chronic: Dict[str, Any],
-    risk: Dict[str, Any],
-    safety: Dict[str, Any],
-    treatment_name: str,
-    priority: int
-) -> Dict[str, Any]:
-    """
-    Generate comparison metrics for a treatment option.
-    
-    Args:
-        surgical: Surgical agent output
-        chronic: Chronic care agent output
-        risk: Risk agent output
-        safety: Safety agent output
-        treatment_name: Name of treatment
-        priority: Priority ranking (1 or 2)
-    
-    Returns:
-        Treatment comparison dictionary
-    """
-    # Calculate overall safety score (inverse of severity)
-    safety_score = max(0, 10 - safety.get("severity_score", 5))
-    
-    # Calculate effectiveness (based on feasibility and stability)
-    effectiveness_score = 7.0  # Default moderate
-    if surgical.get("surgical_feasibility") == "high":
-        effectiveness_score += 1.5
-    if chronic.get("disease_stability") == "excellent":
-        effectiveness_score += 1.5
-    effectiveness_score = min(10, effectiveness_score)
-    
-    # Calculate patient burden (combination of invasiveness and medication burden)
-    invasiveness = surgical.get("invasiveness_score", 5)
-    medication_burden = chronic.get("medication_burden_score", 5)
-    patient_burden_score = (invasiveness + medication_burden) / 2
-    
-    # Determine cost-benefit ratio
-    if effectiveness_score > 7 and patient_burden_score < 5:
-        cost_benefit = "favorable"
-    elif effectiveness_score < 5 or patient_burden_score > 7:
-        cost_benefit = "unfavorable"
-    else:
-        cost_benefit = "moderate"
-    
-    # Generate summary
-    summary = (
-        f"{treatment_name}: "
-        f"Safety {safety.get('safety_status', 'unknown')}, "
-        f"Effectiveness {effectiveness_score:.1f}/10, "
-        f"Burden {patient_burden_score:.1f}/10. "
-        f"{safety.get('recommendations', '')[:100]}..."
-    )
-    
-    return {
-        "overall_safety_score": round(safety_score, 2),
-        "effectiveness_score": round(effectiveness_score, 2),
-        "patient_burden_score": round(patient_burden_score, 2),
-        "cost_benefit_ratio": cost_benefit,
-        "recommended_priority": priority,
-        "summary": summary
-    }
-
-
-def generate_final_notes(
-    treatment_a: str,
-    treatment_b: str,
-    comparison_a: Dict[str, Any],
-    comparison_b: Dict[str, Any],
-    safety_a: Dict[str, Any],
-    safety_b: Dict[str, Any]
-) -> str:
-    """
-    Generate final clinical notes and recommendations.
-    
-    Args:
-        treatment_a: Name of treatment A
-        treatment_b: Name of treatment B
-        comparison_a: Comparison data for treatment A
-        comparison_b: Comparison data for treatment B
-        safety_a: Safety assessment for treatment A
-        safety_b: Safety assessment for treatment B
-    
-    Returns:
-        Final notes string
-    """
-    notes = []
-    
-    notes.append("CLINICAL DECISION SUPPORT SUMMARY")
-    notes.append("=" * 60)
-    notes.append("")
-    
-    # Safety warnings
-    if safety_a.get("safety_status") == "high-risk":
-        notes.append(f"⚠️ WARNING: {treatment_a} flagged as HIGH RISK")
-        notes.append(f"   Contraindications: {', '.join(safety_a.get('identified_contraindications', [])[:3])}")
-        notes.append("")
-    
-    if safety_b.get("safety_status") == "high-risk":
-        notes.append(f"⚠️ WARNING: {treatment_b} flagged as HIGH RISK")
-        notes.append(f"   Contraindications: {', '.join(safety_b.get('identified_contraindications', [])[:3])}")
-        notes.append("")
-    
-    # Comparison summary
-    notes.append("TREATMENT COMPARISON:")
-    notes.append(f"  {treatment_a}:")
-    notes.append(f"    - Safety: {comparison_a['overall_safety_score']}/10")
-    notes.append(f"    - Effectiveness: {comparison_a['effectiveness_score']}/10")
-    notes.append(f"    - Patient Burden: {comparison_a['patient_burden_score']}/10")
-    notes.append("")
-    notes.append(f"  {treatment_b}:")
-    notes.append(f"    - Safety: {comparison_b['overall_safety_score']}/10")
-    notes.append(f"    - Effectiveness: {comparison_b['effectiveness_score']}/10")
-    notes.append(f"    - Patient Burden: {comparison_b['patient_burden_score']}/10")
-    notes.append("")
-    
-    # Recommendation
-    notes.append("RECOMMENDATION:")
-    notes.append("This is an AI-assisted clinical decision support tool.")
-    notes.append("Final treatment decisions MUST be made by qualified healthcare providers")
-    notes.append("considering the complete clinical context and patient preferences.")
-    notes.append("")
-    notes.append("All identified contraindications and safety warnings should be")
-    notes.append("thoroughly reviewed before proceeding with any treatment.")
-    
-    return "\n".join(notes)
-
-
-@app.exception_handler(Exception)
-async def global_exception_handler(request, exc):
-    """Global exception handler to prevent server crashes"""
-    logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    
-    return JSONResponse(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-        content=ErrorResponse(
-            error="Internal server error",
-            detail=str(exc),
-            timestamp=datetime.now().isoformat()
-        ).dict()
-    )
-
-
-if __name__ == "__main__":
-    import uvicorn
-    
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+"""
+FastAPI Medical Decision Support System
+Multi-Agent Orchestration Backend
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, AsyncIterator, List
+from contextlib import asynccontextmanager
+
+import numpy as np
+from dotenv import load_dotenv
+
+import orjson
+from fastapi import BackgroundTasks, FastAPI, HTTPException, status
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+
+from models import (
+    SimulationRequest,
+    SimulationResponse,
+    SurgicalOutput,
+    ChronicCareOutput,
+    RiskOutput,
+    SafetyOutput,
+    HealthResponse,
+    ErrorResponse
+)
+from services import GeminiClient, create_http_client
+from agents import (
+    SurgicalPlanningAgent,
+    ChronicCareAgent,
+    RiskAssessmentAgent,
+    SafetyContraindicationAgent
+)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Global instances
+gemini_client: GeminiClient = None          # fast tier: surgical/chronic/risk
+safety_gemini_client: GeminiClient = None   # pro tier: safety agent
+surgical_agent: SurgicalPlanningAgent = None
+chronic_care_agent: ChronicCareAgent = None
+risk_agent: RiskAssessmentAgent = None
+safety_agent: SafetyContraindicationAgent = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application lifespan manager - startup and shutdown"""
+    global gemini_client, safety_gemini_client
+    global surgical_agent, chronic_care_agent, risk_agent, safety_agent
+
+    # Startup
+    logger.info("🚀 Starting Medical Decision Support System...")
+
+    # Shared pooled HTTP/2 client - all Gemini calls reuse its keep-alive
+    # connections instead of paying TCP + TLS handshake per call
+    http_client = create_http_client()
+
+    try:
+        # Model tiering: the three structured-output agents run on the
+        # faster, cheaper flash tier, while the safety agent - which
+        # reasons over the other agents' outputs - stays on pro
+        gemini_client = GeminiClient(
+            model_name=os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+            http_client=http_client
+        )
+        safety_gemini_client = GeminiClient(
+            model_name=os.getenv("GEMINI_SAFETY_MODEL", "gemini-1.5-pro"),
+            http_client=http_client
+        )
+        logger.info("✓ Gemini clients initialized")
+
+        # Initialize all agents
+        surgical_agent = SurgicalPlanningAgent(gemini_client)
+        chronic_care_agent = ChronicCareAgent(gemini_client)
+        risk_agent = RiskAssessmentAgent(gemini_client)
+        safety_agent = SafetyContraindicationAgent(safety_gemini_client)
+        
+        logger.info("✓ All agents initialized successfully")
+
+        # Pre-warm the shared connection pool and cache each agent's
+        # static prompt scaffolding server-side, so neither the TLS/HTTP2
+        # setup nor the stable prefix processing lands on the first request
+        await asyncio.gather(
+            gemini_client.warm_up(),
+            chronic_care_agent.init_prompt_cache(),
+            risk_agent.init_prompt_cache()
+        )
+        logger.info("✓ Prompt scaffold caches initialized")
+
+        logger.info("🎯 System ready to accept requests")
+        
+    except Exception as e:
+        logger.error("❌ Failed to initialize system: %s", str(e))
+        raise
+    
+    yield
+
+    # Shutdown
+    logger.info("🛑 Shutting down Medical Decision Support System...")
+    await http_client.aclose()
+
+
+# Create FastAPI app
+app = FastAPI(
+    title="Medical Decision Support API",
+    description="Multi-Agent Medical Decision Support System using Gemini AI",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+# Configure CORS. Origins come from CORS_ORIGINS (comma-separated),
+# defaulting to the Vite dev server. A static origin tuple lets the
+# middleware answer preflights without per-request origin echoing, and
+# max_age lets browsers cache the preflight response for 24h.
+_cors_origins = tuple(
+    origin.strip()
+    for origin in os.getenv(
+        "CORS_ORIGINS",
+        "http://localhost:5173,http://127.0.0.1:5173"
+    ).split(",")
+    if origin.strip()
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=_cors_origins,
+    allow_credentials=True,
+    allow_methods=("GET", "POST"),
+    allow_headers=("content-type", "authorization"),
+    max_age=86400,
+)
+
+
+@app.get("/", tags=["Root"])
+async def root():
+    """Root endpoint"""
+    return {
+        "message": "Medical Decision Support API",
+        "version": "1.0.0",
+        "status": "operational",
+        "endpoints": {
+            "health": "/health",
+            "simulate": "/simulate (POST)",
+            "docs": "/docs"
+        }
+    }
+
+
+@app.get("/health", response_model=HealthResponse, tags=["Health"])
+async def health_check():
+    """
+    Health check endpoint to verify system status.
+    
+    Returns:
+        HealthResponse with system status
+    """
+    try:
+        # Check if agents are initialized
+        if not all([surgical_agent, chronic_care_agent, risk_agent, safety_agent]):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Agents not initialized"
+            )
+        
+        # Check Gemini connectivity
+        gemini_healthy = (
+            gemini_client.check_health()
+            and safety_gemini_client.check_health()
+        )
+        
+        if not gemini_healthy:
+            logger.warning("Gemini API health check failed")
+        
+        return HealthResponse(
+            status="healthy" if gemini_healthy else "degraded",
+            message="All systems operational" if gemini_healthy else "Gemini API connectivity issues",
+            timestamp=datetime.now().isoformat()
+        )
+    
+    except Exception as e:
+        logger.error("Health check failed: %s", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Health check failed: {str(e)}"
+        )
+
+
+@app.post("/simulate", response_model=SimulationResponse, tags=["Simulation"])
+async def simulate_treatment(request: SimulationRequest, background_tasks: BackgroundTasks):
+    """
+    Run multi-agent medical decision support simulation.
+
+    Args:
+        request: SimulationRequest with patient data and treatment options
+        background_tasks: FastAPI background task queue for post-hoc logging
+
+    Returns:
+        SimulationResponse with agent outputs and comparison
+    """
+    logger.info("📋 New simulation request received")
+
+    try:
+        # Orchestrate multi-agent analysis
+        result = await orchestrate_agents(
+            patient_summary=request.patient_summary,
+            treatment_a=request.treatment_a,
+            treatment_b=request.treatment_b,
+            simulation_horizon=request.simulation_horizon
+        )
+
+        # Post-hoc analytics logging runs after the response is sent,
+        # keeping it off the client's critical path
+        background_tasks.add_task(log_completed_simulation, request, result)
+        return result
+
+    except Exception as e:
+        logger.error("❌ Simulation failed: %s", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Simulation failed: {str(e)}"
+        )
+
+
+@app.post("/simulate/stream", tags=["Simulation"])
+async def simulate_treatment_stream(request: SimulationRequest):
+    """
+    Run the multi-agent simulation, streaming partial results over SSE.
+
+    Each agent's output is emitted as a Server-Sent Event as soon as it
+    completes, so time-to-first-byte is the fastest agent's latency
+    instead of the whole pipeline's.
+
+    Args:
+        request: SimulationRequest with patient data and treatment options
+
+    Returns:
+        StreamingResponse emitting one event per agent, then a terminal
+        event carrying the comparison and final notes
+    """
+    logger.info("📋 New streaming simulation request received")
+
+    return StreamingResponse(
+        stream_simulation_events(
+            patient_summary=request.patient_summary,
+            treatment_a=request.treatment_a,
+            treatment_b=request.treatment_b,
+            simulation_horizon=request.simulation_horizon
+        ),
+        media_type="text/event-stream"
+    )
+
+
+def log_completed_simulation(request: SimulationRequest, result: SimulationResponse) -> None:
+    """
+    Log details of a completed simulation.
+
+    Runs as a background task after the HTTP response has been sent.
+
+    Args:
+        request: The original simulation request
+        result: The completed simulation response
+    """
+    logger.info("   Patient: %s...", request.patient_summary[:100])
+    logger.info("   Treatment A: %s", request.treatment_a)
+    logger.info("   Treatment B: %s", request.treatment_b)
+    logger.info("   Horizon: %s days", request.simulation_horizon)
+    logger.info("✅ Simulation completed successfully")
+
+
+async def orchestrate_agents(
+    patient_summary: str,
+    treatment_a: str,
+    treatment_b: str,
+    simulation_horizon: int
+) -> SimulationResponse:
+    """
+    Orchestrate all agents to analyze both treatment options.
+
+    Runs as two concurrent stages: the surgical, chronic-care and risk
+    agents have no dependencies on each other and are gathered together,
+    then the safety agent - which consumes their outputs - runs its two
+    per-treatment calls as a second gather. Wall time is therefore the
+    slowest independent agent plus the slowest safety call, not the sum
+    of all Gemini round-trips.
+
+    Args:
+        patient_summary: Patient clinical summary
+        treatment_a: First treatment option
+        treatment_b: Second treatment option
+        simulation_horizon: Days to simulate
+
+    Returns:
+        Complete simulation response
+    """
+    logger.info("🤖 Orchestrating multi-agent analysis...")
+
+    # Cache the patient summary once per request so every agent call reuses
+    # the same server-side prefill instead of re-tokenizing it
+    patient_cache = await gemini_client.create_cached_content(
+        content_text=f"PATIENT SUMMARY (including comorbidities):\n{patient_summary}",
+        ttl="120s"
+    )
+
+    try:
+        # Surgical, chronic care and risk analyses are independent of each
+        # other, and each agent covers both treatments in a single batched
+        # Gemini call
+        logger.info("🔍 Analyzing Treatments A and B concurrently...")
+        treatments = [treatment_a, treatment_b]
+        (
+            (surgical_a, surgical_b),
+            (chronic_a, chronic_b),
+            (risk_a, risk_b)
+        ) = await asyncio.gather(
+            surgical_agent.analyze_batch(
+                patient_summary, treatments, simulation_horizon,
+                patient_cache=patient_cache
+            ),
+            chronic_care_agent.analyze_batch(
+                patient_summary, treatments, simulation_horizon,
+                patient_cache=patient_cache
+            ),
+            risk_agent.analyze_batch(
+                patient_summary, treatments, simulation_horizon,
+                patient_cache=patient_cache
+            )
+        )
+
+        # Safety agent depends on the other three agents' outputs, so it
+        # runs as a second stage - one batched call screening both
+        # treatments. cachedContents are bound to the model that created
+        # them, so the fast-tier patient cache is not attached to the
+        # pro-tier safety call.
+        logger.info("🛡️ Running safety analysis for both treatments...")
+        safety_a, safety_b = await safety_agent.analyze_batch(
+            patient_summary,
+            treatments,
+            [
+                {
+                    "surgical_agent": surgical_a,
+                    "chronic_care_agent": chronic_a,
+                    "risk_agent": risk_a
+                },
+                {
+                    "surgical_agent": surgical_b,
+                    "chronic_care_agent": chronic_b,
+                    "risk_agent": risk_b
+                }
+            ]
+        )
+    finally:
+        if patient_cache:
+            await gemini_client.delete_cached_content(patient_cache)
+
+    # Parse each raw response into its validated output model once;
+    # all downstream reads are attribute access instead of repeated
+    # dict.get(..., default) chains
+    surgical_a = SurgicalOutput.model_validate(surgical_a)
+    surgical_b = SurgicalOutput.model_validate(surgical_b)
+    chronic_a = ChronicCareOutput.model_validate(chronic_a)
+    chronic_b = ChronicCareOutput.model_validate(chronic_b)
+    risk_a = RiskOutput.model_validate(risk_a)
+    risk_b = RiskOutput.model_validate(risk_b)
+    safety_a = SafetyOutput.model_validate(safety_a)
+    safety_b = SafetyOutput.model_validate(safety_b)
+
+    # Generate comparison for both treatments in one vectorized pass
+    logger.info("📊 Generating treatment comparison...")
+    comparison_a, comparison_b = generate_treatment_comparisons(
+        surgical=[surgical_a, surgical_b],
+        chronic=[chronic_a, chronic_b],
+        risk=[risk_a, risk_b],
+        safety=[safety_a, safety_b],
+        treatment_names=[treatment_a, treatment_b]
+    )
+    
+    # Generate final notes
+    final_notes = generate_final_notes(
+        treatment_a=treatment_a,
+        treatment_b=treatment_b,
+        comparison_a=comparison_a,
+        comparison_b=comparison_b,
+        safety_a=safety_a,
+        safety_b=safety_b
+    )
+    
+    return SimulationResponse(
+        agents={
+            "surgical_agent": {
+                "treatment_a": surgical_a,
+                "treatment_b": surgical_b
+            },
+            "chronic_care_agent": {
+                "treatment_a": chronic_a,
+                "treatment_b": chronic_b
+            },
+            "risk_agent": {
+                "treatment_a": risk_a,
+                "treatment_b": risk_b
+            },
+            "safety_agent": {
+                "treatment_a": safety_a,
+                "treatment_b": safety_b
+            }
+        },
+        comparison={
+            "treatment_a": comparison_a,
+            "treatment_b": comparison_b
+        },
+        final_notes=final_notes
+    )
+
+
+def _sse_event(event: str, payload: Any) -> bytes:
+    """Serialize one Server-Sent Event frame."""
+    return b"data: " + orjson.dumps({"event": event, "payload": payload}) + b"\n\n"
+
+
+async def _tagged(name: str, coro) -> Any:
+    """Await a coroutine and return its result tagged with a name."""
+    return name, await coro
+
+
+async def stream_simulation_events(
+    patient_summary: str,
+    treatment_a: str,
+    treatment_b: str,
+    simulation_horizon: int
+) -> AsyncIterator[bytes]:
+    """
+    Run the agent pipeline, yielding an SSE frame per completed agent.
+
+    Same two-stage orchestration as orchestrate_agents, but each agent's
+    output is emitted the moment asyncio.as_completed yields it instead
+    of being held until the whole simulation finishes.
+
+    Args:
+        patient_summary: Patient clinical summary
+        treatment_a: First treatment option
+        treatment_b: Second treatment option
+        simulation_horizon: Days to simulate
+
+    Yields:
+        SSE frames: one per agent, then a terminal "complete" frame with
+        the comparison and final notes
+    """
+    logger.info("🤖 Orchestrating multi-agent analysis (streaming)...")
+
+    patient_cache = await gemini_client.create_cached_content(
+        content_text=f"PATIENT SUMMARY (including comorbidities):\n{patient_summary}",
+        ttl="120s"
+    )
+
+    treatments = [treatment_a, treatment_b]
+    outputs: Dict[str, Any] = {}
+
+    try:
+        stage_one = [
+            asyncio.ensure_future(_tagged(name, agent.analyze_batch(
+                patient_summary, treatments, simulation_horizon,
+                patient_cache=patient_cache
+            )))
+            for name, agent in (
+                ("surgical_agent", surgical_agent),
+                ("chronic_care_agent", chronic_care_agent),
+                ("risk_agent", risk_agent)
+            )
+        ]
+        for task in asyncio.as_completed(stage_one):
+            name, (result_a, result_b) = await task
+            outputs[name] = (result_a, result_b)
+            yield _sse_event(name, {"treatment_a": result_a, "treatment_b": result_b})
+
+        surgical_a, surgical_b = outputs["surgical_agent"]
+        chronic_a, chronic_b = outputs["chronic_care_agent"]
+        risk_a, risk_b = outputs["risk_agent"]
+
+        # The fast-tier patient cache is model-bound, so the pro-tier
+        # safety calls take the patient summary inline
+        stage_two = [
+            asyncio.ensure_future(_tagged("treatment_a", safety_agent.analyze(
+                patient_summary=patient_summary,
+                treatment_option=treatment_a,
+                other_agent_outputs={
+                    "surgical_agent": surgical_a,
+                    "chronic_care_agent": chronic_a,
+                    "risk_agent": risk_a
+                }
+            ))),
+            asyncio.ensure_future(_tagged("treatment_b", safety_agent.analyze(
+                patient_summary=patient_summary,
+                treatment_option=treatment_b,
+                other_agent_outputs={
+                    "surgical_agent": surgical_b,
+                    "chronic_care_agent": chronic_b,
+                    "risk_agent": risk_b
+                }
+            )))
+        ]
+        safety_results: Dict[str, Any] = {}
+        for task in asyncio.as_completed(stage_two):
+            name, result = await task
+            safety_results[name] = result
+            yield _sse_event("safety_agent", {name: result})
+    finally:
+        if patient_cache:
+            await gemini_client.delete_cached_content(patient_cache)
+
+    surgical_a = SurgicalOutput.model_validate(surgical_a)
+    surgical_b = SurgicalOutput.model_validate(surgical_b)
+    chronic_a = ChronicCareOutput.model_validate(chronic_a)
+    chronic_b = ChronicCareOutput.model_validate(chronic_b)
+    safety_a = SafetyOutput.model_validate(safety_results["treatment_a"])
+    safety_b = SafetyOutput.model_validate(safety_results["treatment_b"])
+
+    comparison_a, comparison_b = generate_treatment_comparisons(
+        surgical=[surgical_a, surgical_b],
+        chronic=[chronic_a, chronic_b],
+        risk=[RiskOutput.model_validate(risk_a), RiskOutput.model_validate(risk_b)],
+        safety=[safety_a, safety_b],
+        treatment_names=[treatment_a, treatment_b]
+    )
+    final_notes = generate_final_notes(
+        treatment_a=treatment_a,
+        treatment_b=treatment_b,
+        comparison_a=comparison_a,
+        comparison_b=comparison_b,
+        safety_a=safety_a,
+        safety_b=safety_b
+    )
+
+    yield _sse_event("complete", {
+        "comparison": {
+            "treatment_a": comparison_a,
+            "treatment_b": comparison_b
+        },
+        "final_notes": final_notes
+    })
+
+
+def generate_treatment_comparisons(
+    surgical: List[SurgicalOutput],
+    chronic: List[ChronicCareOutput],
+    risk: List[RiskOutput],
+    safety: List[SafetyOutput],
+    treatment_names: List[str]
+) -> List[Dict[str, Any]]:
+    """
+    Generate comparison metrics for all treatment options at once.
+
+    The per-treatment inputs are stacked into a struct-of-arrays matrix and
+    all scores are computed in a single vectorized pass, so the math scales
+    to N treatments without per-treatment Python arithmetic.
+
+    Args:
+        surgical: Surgical agent outputs, one per treatment
+        chronic: Chronic care agent outputs, one per treatment
+        risk: Risk agent outputs, one per treatment
+        safety: Safety agent outputs, one per treatment
+        treatment_names: Names of the treatments, in the same order
+
+    Returns:
+        Treatment comparison dictionaries, in input order
+    """
+    # Columns: severity, invasiveness, medication burden,
+    # feasibility flag, stability flag
+    arr = np.array([
+        [
+            safety[i].severity_score,
+            surgical[i].invasiveness_score,
+            chronic[i].medication_burden_score,
+            1.0 if surgical[i].surgical_feasibility == "high" else 0.0,
+            1.0 if chronic[i].disease_stability == "excellent" else 0.0
+        ]
+        for i in range(len(treatment_names))
+    ], dtype=float)
+
+    # Overall safety score (inverse of severity)
+    safety_scores = np.maximum(0, 10 - arr[:, 0])
+
+    # Effectiveness (based on feasibility and stability)
+    effectiveness_scores = np.minimum(10, 7.0 + 1.5 * arr[:, 3] + 1.5 * arr[:, 4])
+
+    # Patient burden (combination of invasiveness and medication burden)
+    patient_burden_scores = (arr[:, 1] + arr[:, 2]) / 2
+
+    # Cost-benefit ratio
+    cost_benefits = np.where(
+        (effectiveness_scores > 7) & (patient_burden_scores < 5),
+        "favorable",
+        np.where(
+            (effectiveness_scores < 5) | (patient_burden_scores > 7),
+            "unfavorable",
+            "moderate"
+        )
+    )
+
+    comparisons = []
+    for i, treatment_name in enumerate(treatment_names):
+        summary = (
+            f"{treatment_name}: "
+            f"Safety {safety[i].safety_status}, "
+            f"Effectiveness {effectiveness_scores[i]:.1f}/10, "
+            f"Burden {patient_burden_scores[i]:.1f}/10. "
+            f"{safety[i].recommendations[:100]}..."
+        )
+
+        comparisons.append({
+            "overall_safety_score": round(float(safety_scores[i]), 2),
+            "effectiveness_score": round(float(effectiveness_scores[i]), 2),
+            "patient_burden_score": round(float(patient_burden_scores[i]), 2),
+            "cost_benefit_ratio": str(cost_benefits[i]),
+            "recommended_priority": i + 1,
+            "summary": summary
+        })
+
+    return comparisons
+
+
+# Final notes structure is fixed, so the whole document is one precomputed
+# template formatted in a single pass instead of list-append-then-join
+_NOTES_TEMPLATE = (
+    "CLINICAL DECISION SUPPORT SUMMARY\n"
+    + "=" * 60
+    + """
+
+{warnings_a}{warnings_b}TREATMENT COMPARISON:
+  {treatment_a}:
+    - Safety: {safety_a}/10
+    - Effectiveness: {effectiveness_a}/10
+    - Patient Burden: {burden_a}/10
+
+  {treatment_b}:
+    - Safety: {safety_b}/10
+    - Effectiveness: {effectiveness_b}/10
+    - Patient Burden: {burden_b}/10
+
+RECOMMENDATION:
+This is an AI-assisted clinical decision support tool.
+Final treatment decisions MUST be made by qualified healthcare providers
+considering the complete clinical context and patient preferences.
+
+All identified contraindications and safety warnings should be
+thoroughly reviewed before proceeding with any treatment."""
+)
+
+_WARNING_TEMPLATE = (
+    "⚠️ WARNING: {treatment} flagged as HIGH RISK\n"
+    "   Contraindications: {contraindications}\n\n"
+)
+
+
+def generate_final_notes(
+    treatment_a: str,
+    treatment_b: str,
+    comparison_a: Dict[str, Any],
+    comparison_b: Dict[str, Any],
+    safety_a: SafetyOutput,
+    safety_b: SafetyOutput
+) -> str:
+    """
+    Generate final clinical notes and recommendations.
+
+    Args:
+        treatment_a: Name of treatment A
+        treatment_b: Name of treatment B
+        comparison_a: Comparison data for treatment A
+        comparison_b: Comparison data for treatment B
+        safety_a: Safety assessment for treatment A
+        safety_b: Safety assessment for treatment B
+
+    Returns:
+        Final notes string
+    """
+    warnings_a = (
+        _WARNING_TEMPLATE.format(
+            treatment=treatment_a,
+            contraindications=", ".join(safety_a.identified_contraindications[:3])
+        )
+        if safety_a.safety_status == "high-risk" else ""
+    )
+    warnings_b = (
+        _WARNING_TEMPLATE.format(
+            treatment=treatment_b,
+            contraindications=", ".join(safety_b.identified_contraindications[:3])
+        )
+        if safety_b.safety_status == "high-risk" else ""
+    )
+
+    return _NOTES_TEMPLATE.format(
+        warnings_a=warnings_a,
+        warnings_b=warnings_b,
+        treatment_a=treatment_a,
+        safety_a=comparison_a["overall_safety_score"],
+        effectiveness_a=comparison_a["effectiveness_score"],
+        burden_a=comparison_a["patient_burden_score"],
+        treatment_b=treatment_b,
+        safety_b=comparison_b["overall_safety_score"],
+        effectiveness_b=comparison_b["effectiveness_score"],
+        burden_b=comparison_b["patient_burden_score"]
+    )
+
+
+@app.exception_handler(Exception)
+async def global_exception_handler(request, exc):
+    """Global exception handler to prevent server crashes"""
+    logger.error("Unhandled exception: %s", str(exc), exc_info=True)
+    
+    return ORJSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content=ErrorResponse(
+            error="Internal server error",
+            detail=str(exc),
+            timestamp=datetime.now().isoformat()
+        ).dict()
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+    
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=True,
+        log_level="info"
+    )
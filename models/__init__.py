@@ -0,0 +1,22 @@
+"""Models package"""
+from .schemas import (
+    SimulationRequest,
+    SimulationResponse,
+    SurgicalOutput,
+    ChronicCareOutput,
+    RiskOutput,
+    SafetyOutput,
+    HealthResponse,
+    ErrorResponse
+)
+
+__all__ = [
+    "SimulationRequest",
+    "SimulationResponse",
+    "SurgicalOutput",
+    "ChronicCareOutput",
+    "RiskOutput",
+    "SafetyOutput",
+    "HealthResponse",
+    "ErrorResponse"
+]
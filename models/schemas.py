@@ -0,0 +1,123 @@
+"""
+Pydantic Request/Response Models
+"""
+from typing import Any, Dict, List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class SimulationRequest(BaseModel):
+    """Request body for the /simulate endpoint."""
+
+    patient_summary: str = Field(
+        ...,
+        min_length=10,
+        description="Patient clinical summary including comorbidities"
+    )
+    treatment_a: str = Field(
+        ...,
+        min_length=2,
+        description="First treatment option to evaluate"
+    )
+    treatment_b: str = Field(
+        ...,
+        min_length=2,
+        description="Second treatment option to evaluate"
+    )
+    simulation_horizon: int = Field(
+        default=90,
+        ge=1,
+        le=3650,
+        description="Number of days to simulate"
+    )
+
+
+class SimulationResponse(BaseModel):
+    """Response body for the /simulate endpoint."""
+
+    agents: Dict[str, Any] = Field(
+        ...,
+        description="Per-agent analysis results for both treatments"
+    )
+    comparison: Dict[str, Any] = Field(
+        ...,
+        description="Comparison metrics for both treatments"
+    )
+    final_notes: str = Field(
+        ...,
+        description="Final clinical decision support notes"
+    )
+
+
+# Per-agent output models. Each raw Gemini response is parsed once after
+# schema validation; downstream code then reads attributes instead of
+# repeating dict.get(..., default) chains. Defaults mirror the fallbacks
+# those chains used. Extra fields are kept so nothing the model returned
+# is dropped from the API response.
+
+class SurgicalOutput(BaseModel):
+    """Validated Surgical Planning Agent output."""
+
+    model_config = ConfigDict(extra="allow")
+
+    surgical_feasibility: str = "unknown"
+    invasiveness_score: float = 5.0
+    recovery_time_days: int = 0
+    procedural_complexity: str = "unknown"
+    anesthesia_risk: str = "unknown"
+    insights: str = ""
+
+
+class ChronicCareOutput(BaseModel):
+    """Validated Chronic Care Agent output."""
+
+    model_config = ConfigDict(extra="allow")
+
+    long_term_management: str = ""
+    medication_burden_score: float = 5.0
+    lifestyle_impact: str = "unknown"
+    disease_stability: str = "unknown"
+    follow_up_frequency: str = "unknown"
+    insights: str = ""
+
+
+class RiskOutput(BaseModel):
+    """Validated Risk Assessment Agent output."""
+
+    model_config = ConfigDict(extra="allow")
+
+    complication_probability: float = 0.0
+    readmission_risk: str = "unknown"
+    uncertainty_level: str = "unknown"
+    key_risk_factors: List[str] = Field(default_factory=list)
+    mitigation_strategies: List[str] = Field(default_factory=list)
+    insights: str = ""
+
+
+class SafetyOutput(BaseModel):
+    """Validated Safety & Contraindication Agent output."""
+
+    model_config = ConfigDict(extra="allow")
+
+    safety_status: str = "unknown"
+    identified_contraindications: List[str] = Field(default_factory=list)
+    severity_score: float = 5.0
+    drug_interactions: List[str] = Field(default_factory=list)
+    clinical_warnings: List[str] = Field(default_factory=list)
+    recommendations: str = ""
+
+
+class HealthResponse(BaseModel):
+    """Response body for the /health endpoint."""
+
+    status: str
+    message: str
+    timestamp: str
+
+
+class ErrorResponse(BaseModel):
+    """Standard error response body."""
+
+    error: str
+    detail: str
+    timestamp: str
@@ -1,142 +1,400 @@
-"""
-Risk Assessment Agent
-"""
-import logging
-from typing import Dict, Any
-from services.gemini_client import GeminiClient
-from utils.json_guard import safe_get
-
-logger = logging.getLogger(__name__)
-
-
-class RiskAssessmentAgent:
-    """
-    Agent responsible for clinical risk assessment and complication analysis.
-    """
-    
-    def __init__(self, gemini_client: GeminiClient):
-        """
-        Initialize Risk Assessment Agent.
-        
-        Args:
-            gemini_client: Configured Gemini client instance
-        """
-        self.gemini = gemini_client
-        self.agent_name = "Risk Assessment Agent"
-    
-    def analyze(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        simulation_horizon: int
-    ) -> Dict[str, Any]:
-        """
-        Analyze clinical risks and complications for treatment.
-        
-        Args:
-            patient_summary: Patient clinical summary
-            treatment_option: Treatment to analyze
-            simulation_horizon: Days to simulate
-        
-        Returns:
-            Risk assessment results
-        """
-        logger.info(f"{self.agent_name}: Analyzing treatment: {treatment_option}")
-        
-        prompt = self._build_prompt(patient_summary, treatment_option, simulation_horizon)
-        
-        response = self.gemini.generate_json_response(
-            prompt=prompt,
-            system_instruction="You are a clinical risk assessment expert AI assistant."
-        )
-        
-        # Handle error responses
-        if safe_get(response, "error"):
-            logger.error(f"{self.agent_name}: {response.get('error')}")
-            return self._create_fallback_response(treatment_option, error=True)
-        
-        # Validate required fields
-        required_fields = [
-            "complication_probability",
-            "readmission_risk",
-            "uncertainty_level",
-            "key_risk_factors",
-            "mitigation_strategies",
-            "insights"
-        ]
-        
-        if all(field in response for field in required_fields):
-            logger.info(f"{self.agent_name}: Analysis completed successfully")
-            return response
-        
-        logger.warning(f"{self.agent_name}: Incomplete response, using fallback")
-        return self._create_fallback_response(treatment_option)
-    
-    def _build_prompt(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        simulation_horizon: int
-    ) -> str:
-        """Build analysis prompt."""
-        return f"""
-You are a clinical risk assessment expert. Analyze the risks and potential complications of the following treatment.
-
-PATIENT SUMMARY:
-{patient_summary}
-
-TREATMENT OPTION:
-{treatment_option}
-
-SIMULATION HORIZON: {simulation_horizon} days
-
-Provide a detailed risk assessment with the following JSON structure:
-
-{{
-  "complication_probability": <float 0-1, probability of complications>,
-  "readmission_risk": "<low/moderate/high/very-high>",
-  "uncertainty_level": "<low/moderate/high>",
-  "key_risk_factors": [
-    "<risk factor 1>",
-    "<risk factor 2>",
-    "<risk factor 3>"
-  ],
-  "mitigation_strategies": [
-    "<strategy 1>",
-    "<strategy 2>",
-    "<strategy 3>"
-  ],
-  "insights": "<detailed explanation of risk factors, uncertainty sources, and recommendations>"
-}}
-
-Consider:
-- Patient-specific risk factors (age, comorbidities, frailty)
-- Treatment-related complications
-- Historical outcomes data
-- Drug interactions and adverse effects
-- Hospital readmission likelihood
-- Uncertainty in diagnosis or prognosis
-
-Respond ONLY with valid JSON.
-"""
-    
-    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
-        """Create fallback response when Gemini fails."""
-        return {
-            "complication_probability": 0.0 if error else 0.25,
-            "readmission_risk": "unknown" if error else "moderate",
-            "uncertainty_level": "high" if error else "moderate",
-            "key_risk_factors": [
-                "Unable to assess risk factors - system error" if error else "Standard treatment risks",
-                "Manual clinical review required" if error else "Patient-specific factors"
-            ],
-            "mitigation_strategies": [
-                "Consult clinical team immediately" if error else "Standard monitoring protocols",
-                "Perform comprehensive risk assessment" if error else "Patient education"
-            ],
-            "insights": (
-                f"Error analyzing risks for {treatment}. Manual review required."
-                if error
-                else f"Standard risk considerations for {treatment}. Further evaluation recommended."
-            )
-        }
+"""
+Risk Assessment Agent
+"""
+import asyncio
+import logging
+from typing import Dict, Any, List
+
+import fastjsonschema
+
+from services.gemini_client import GeminiClient
+from utils.json_guard import safe_get
+from utils.response_cache import make_cache_key, cache_get, cache_put, coalesce
+from utils.semantic_cache import semantic_get, semantic_put
+
+logger = logging.getLogger(__name__)
+
+# Static prompt scaffolding, hoisted to module constants so analyze() only
+# assembles the small dynamic tail per call and the cacheable prefix stays
+# byte-identical. Output structure is enforced by the response schema below,
+# so the prompt only carries the clinical guidance.
+_PROMPT_SCAFFOLD = """You are a clinical risk assessment expert. Analyze the risks and potential complications of a proposed treatment.
+
+Report:
+- complication_probability: 0-1, probability of complications
+- readmission_risk: low/moderate/high/very-high
+- uncertainty_level: low/moderate/high
+- key_risk_factors: list of patient- and treatment-specific risk factors
+- mitigation_strategies: list of strategies addressing the identified risks
+- insights: detailed explanation of risk factors, uncertainty sources, and recommendations
+
+Consider:
+- Patient-specific risk factors (age, comorbidities, frailty)
+- Treatment-related complications
+- Historical outcomes data
+- Drug interactions and adverse effects
+- Hospital readmission likelihood
+- Uncertainty in diagnosis or prognosis
+
+Analyze the patient and treatment described below.
+"""
+
+_BATCH_PROMPT_SCAFFOLD = """You are a clinical risk assessment expert. Analyze the risks and potential complications of EACH of the proposed treatments independently, producing one entry in "results" per treatment, in the same order the treatments are listed.
+
+For each treatment report:
+- complication_probability: 0-1, probability of complications
+- readmission_risk: low/moderate/high/very-high
+- uncertainty_level: low/moderate/high
+- key_risk_factors: list of patient- and treatment-specific risk factors
+- mitigation_strategies: list of strategies addressing the identified risks
+- insights: detailed explanation of risk factors, uncertainty sources, and recommendations
+
+Consider:
+- Patient-specific risk factors (age, comorbidities, frailty)
+- Treatment-related complications
+- Historical outcomes data
+- Drug interactions and adverse effects
+- Hospital readmission likelihood
+- Uncertainty in diagnosis or prognosis
+
+Analyze the patient and treatments described below.
+"""
+
+# Gemini structured-output schema (OpenAPI subset, REST casing); the model
+# is forced to emit JSON matching this shape
+_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "complication_probability": {"type": "NUMBER"},
+        "readmission_risk": {
+            "type": "STRING",
+            "enum": ["low", "moderate", "high", "very-high"]
+        },
+        "uncertainty_level": {
+            "type": "STRING",
+            "enum": ["low", "moderate", "high"]
+        },
+        "key_risk_factors": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "mitigation_strategies": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "insights": {"type": "STRING"}
+    },
+    "required": [
+        "complication_probability",
+        "readmission_risk",
+        "uncertainty_level",
+        "key_risk_factors",
+        "mitigation_strategies",
+        "insights"
+    ]
+}
+
+_BATCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "results": {
+            "type": "ARRAY",
+            "items": _RESPONSE_SCHEMA
+        }
+    },
+    "required": ["results"]
+}
+
+
+class RiskAssessmentAgent:
+    """
+    Agent responsible for clinical risk assessment and complication analysis.
+    """
+
+    # Fixed attribute layout: skips the per-instance __dict__ and makes
+    # attribute access a slot lookup on the agent hot path
+    __slots__ = ("gemini", "agent_name", "_cached_content", "_cached_batch_content")
+
+    REQUIRED_FIELDS = [
+        "complication_probability",
+        "readmission_risk",
+        "uncertainty_level",
+        "key_risk_factors",
+        "mitigation_strategies",
+        "insights"
+    ]
+
+    # Largest number of treatments analyzed in one Gemini call; bigger
+    # batches are split so latency stays on the flat part of the curve
+    MAX_BATCH = 8
+
+    # Frozenset view for C-level subset checks on the batch hot path
+    _REQUIRED = frozenset(REQUIRED_FIELDS)
+
+    # Compiled once at class definition; validates types and value ranges
+    # in addition to field presence
+    _VALIDATE = staticmethod(fastjsonschema.compile({
+        "type": "object",
+        "required": REQUIRED_FIELDS,
+        "properties": {
+            "complication_probability": {"type": "number", "minimum": 0, "maximum": 1},
+            "readmission_risk": {"enum": ["low", "moderate", "high", "very-high"]},
+            "uncertainty_level": {"enum": ["low", "moderate", "high"]},
+            "key_risk_factors": {"type": "array", "items": {"type": "string"}},
+            "mitigation_strategies": {"type": "array", "items": {"type": "string"}},
+            "insights": {"type": "string"}
+        }
+    }))
+    
+    def __init__(self, gemini_client: GeminiClient):
+        """
+        Initialize Risk Assessment Agent.
+        
+        Args:
+            gemini_client: Configured Gemini client instance
+        """
+        self.gemini = gemini_client
+        self.agent_name = "Risk Assessment Agent"
+        self._cached_content = None
+        self._cached_batch_content = None
+
+    async def init_prompt_cache(self) -> None:
+        """
+        Cache the static prompt scaffolding server-side.
+
+        Called once at startup; when the caches exist, analyze() and
+        analyze_batch() only send the dynamic patient/treatment tail per call.
+        """
+        self._cached_content = await self.gemini.create_cached_content(
+            content_text=self._scaffold(),
+            system_instruction="You are a clinical risk assessment expert AI assistant."
+        )
+        self._cached_batch_content = await self.gemini.create_cached_content(
+            content_text=self._batch_scaffold(),
+            system_instruction="You are a clinical risk assessment expert AI assistant."
+        )
+        if self._cached_content or self._cached_batch_content:
+            logger.info("%s: Prompt scaffold cached", self.agent_name)
+
+
+    async def analyze(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int
+    ) -> Dict[str, Any]:
+        """
+        Analyze clinical risks and complications for treatment.
+        
+        Args:
+            patient_summary: Patient clinical summary
+            treatment_option: Treatment to analyze
+            simulation_horizon: Days to simulate
+        
+        Returns:
+            Risk assessment results
+        """
+        logger.info("%s: Analyzing treatment: %s", self.agent_name, treatment_option)
+
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, treatment_option, simulation_horizon
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        semantic_text = f"{patient_summary}\n{treatment_option}\nhorizon={simulation_horizon}"
+        # Namespace by call shape: single and batch responses have
+        # different types, and the shared patient summary dominates the
+        # embedding enough for the two to cross-hit otherwise
+        semantic_namespace = f"{self.agent_name}:single"
+        semantic_hit = semantic_get(semantic_namespace, semantic_text)
+        if semantic_hit is not None:
+            return semantic_hit
+
+        prompt = self._build_prompt(patient_summary, treatment_option, simulation_horizon)
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a clinical risk assessment expert AI assistant.",
+            cached_content=self._cached_content,
+            response_schema=_RESPONSE_SCHEMA
+        ))
+        
+        # Handle error responses
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return self._create_fallback_response(treatment_option, error=True)
+        
+        # Validate against the compiled schema
+        try:
+            self._VALIDATE(response)
+        except fastjsonschema.JsonSchemaException as e:
+            logger.warning("%s: Invalid response (%s), using fallback", self.agent_name, e.message)
+            return self._create_fallback_response(treatment_option)
+
+        logger.info("%s: Analysis completed successfully", self.agent_name)
+        cache_put(cache_key, response)
+        semantic_put(semantic_namespace, semantic_text, response)
+        return response
+
+    async def analyze_batch(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        simulation_horizon: int,
+        patient_cache: str = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyze several treatments in a single Gemini call.
+
+        Amortizes the shared prompt prefix and one network round-trip
+        across all treatments instead of paying them per treatment.
+
+        Args:
+            patient_summary: Patient clinical summary
+            treatments: Treatment options to analyze
+            simulation_horizon: Days to simulate
+            patient_cache: Optional cachedContents resource holding the
+                patient summary, shared across all agents in one request
+
+        Returns:
+            One assessment result per treatment, in input order
+        """
+        logger.info("%s: Batch analyzing %d treatments", self.agent_name, len(treatments))
+
+        if len(treatments) > self.MAX_BATCH:
+            # Split oversized batches and run the chunks concurrently
+            chunk_results = await asyncio.gather(*(
+                self.analyze_batch(
+                    patient_summary,
+                    treatments[i:i + self.MAX_BATCH],
+                    simulation_horizon,
+                    patient_cache=patient_cache
+                )
+                for i in range(0, len(treatments), self.MAX_BATCH)
+            ))
+            return [entry for chunk in chunk_results for entry in chunk]
+
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, tuple(treatments), simulation_horizon
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        semantic_text = "\n".join([patient_summary, *treatments, f"horizon={simulation_horizon}"])
+        # Namespaced by shape and size so a hit always carries one entry
+        # per requested treatment (see the single-call path)
+        semantic_namespace = f"{self.agent_name}:batch:{len(treatments)}"
+        semantic_hit = semantic_get(semantic_namespace, semantic_text)
+        if semantic_hit is not None:
+            return semantic_hit
+
+        prompt = self._build_batch_prompt(
+            patient_summary, treatments, simulation_horizon,
+            patient_cached=bool(patient_cache)
+        )
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a clinical risk assessment expert AI assistant.",
+            cached_content=patient_cache or self._cached_batch_content,
+            response_schema=_BATCH_RESPONSE_SCHEMA
+        ))
+
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return [
+                self._create_fallback_response(t, error=True) for t in treatments
+            ]
+
+        results = response.get("results")
+        if not isinstance(results, list) or len(results) != len(treatments):
+            logger.warning("%s: Malformed batch response, using fallbacks", self.agent_name)
+            return [self._create_fallback_response(t) for t in treatments]
+
+        validated = []
+        used_fallback = False
+        for treatment, entry in zip(treatments, results):
+            if isinstance(entry, dict) and entry.keys() >= self._REQUIRED:
+                validated.append(entry)
+            else:
+                logger.warning("%s: Incomplete batch entry, using fallback", self.agent_name)
+                validated.append(self._create_fallback_response(treatment))
+                used_fallback = True
+
+        logger.info("%s: Batch analysis completed successfully", self.agent_name)
+        if not used_fallback:
+            cache_put(cache_key, validated)
+            semantic_put(semantic_namespace, semantic_text, validated)
+        return validated
+
+    def _scaffold(self) -> str:
+        """Static prompt scaffolding (module constant, cacheable prefix)."""
+        return _PROMPT_SCAFFOLD
+
+    def _build_prompt(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int
+    ) -> str:
+        """Build analysis prompt (dynamic tail only when the scaffold is cached)."""
+        dynamic = "".join((
+            "\nPATIENT SUMMARY:\n", patient_summary,
+            "\n\nTREATMENT OPTION:\n", treatment_option,
+            "\n\nSIMULATION HORIZON: ", str(simulation_horizon), " days\n"
+        ))
+        if self._cached_content:
+            return dynamic
+        return _PROMPT_SCAFFOLD + dynamic
+
+    def _batch_scaffold(self) -> str:
+        """Static batch prompt scaffolding (module constant, cacheable prefix)."""
+        return _BATCH_PROMPT_SCAFFOLD
+
+    def _build_batch_prompt(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        simulation_horizon: int,
+        patient_cached: bool = False
+    ) -> str:
+        """Build batch analysis prompt (dynamic tail only when the scaffold is cached)."""
+        treatment_lines = "\n".join(
+            f"{i}. {treatment}" for i, treatment in enumerate(treatments, start=1)
+        )
+        dynamic = "".join((
+            "" if patient_cached else f"\nPATIENT SUMMARY:\n{patient_summary}\n",
+            "\nTREATMENT OPTIONS:\n", treatment_lines,
+            "\n\nSIMULATION HORIZON: ", str(simulation_horizon), " days\n"
+        ))
+        if patient_cached:
+            # Only one cachedContents can be attached per call, and the
+            # patient summary cache wins; send the scaffold inline
+            return _BATCH_PROMPT_SCAFFOLD + dynamic
+        if self._cached_batch_content:
+            return dynamic
+        return _BATCH_PROMPT_SCAFFOLD + dynamic
+    
+    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
+        """Create fallback response when Gemini fails."""
+        return {
+            "complication_probability": 0.0 if error else 0.25,
+            "readmission_risk": "unknown" if error else "moderate",
+            "uncertainty_level": "high" if error else "moderate",
+            "key_risk_factors": [
+                "Unable to assess risk factors - system error" if error else "Standard treatment risks",
+                "Manual clinical review required" if error else "Patient-specific factors"
+            ],
+            "mitigation_strategies": [
+                "Consult clinical team immediately" if error else "Standard monitoring protocols",
+                "Perform comprehensive risk assessment" if error else "Patient education"
+            ],
+            "insights": (
+                f"Error analyzing risks for {treatment}. Manual review required."
+                if error
+                else f"Standard risk considerations for {treatment}. Further evaluation recommended."
+            )
+        }
@@ -1,178 +1,477 @@
-"""
-Safety and Contraindication Agent
-"""
-import logging
-from typing import Dict, Any, List
-from services.gemini_client import GeminiClient
-from utils.json_guard import safe_get
-
-logger = logging.getLogger(__name__)
-
-
-class SafetyContraindicationAgent:
-    """
-    Agent responsible for identifying safety issues and contraindications.
-    This agent DOES NOT override decisions, only FLAGS potential risks.
-    """
-    
-    def __init__(self, gemini_client: GeminiClient):
-        """
-        Initialize Safety Contraindication Agent.
-        
-        Args:
-            gemini_client: Configured Gemini client instance
-        """
-        self.gemini = gemini_client
-        self.agent_name = "Safety Contraindication Agent"
-    
-    def analyze(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        other_agent_outputs: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """
-        Identify safety concerns and contraindications for treatment.
-        
-        Args:
-            patient_summary: Patient clinical summary with comorbidities
-            treatment_option: Recommended treatment path
-            other_agent_outputs: Outputs from surgical, chronic care, and risk agents
-        
-        Returns:
-            Safety assessment with contraindications and warnings
-        """
-        logger.info(f"{self.agent_name}: Analyzing safety for: {treatment_option}")
-        
-        prompt = self._build_prompt(
-            patient_summary,
-            treatment_option,
-            other_agent_outputs
-        )
-        
-        response = self.gemini.generate_json_response(
-            prompt=prompt,
-            system_instruction="You are a clinical safety and contraindication expert AI assistant."
-        )
-        
-        # Handle error responses
-        if safe_get(response, "error"):
-            logger.error(f"{self.agent_name}: {response.get('error')}")
-            return self._create_fallback_response(treatment_option, error=True)
-        
-        # Validate required fields
-        required_fields = [
-            "safety_status",
-            "identified_contraindications",
-            "severity_score",
-            "drug_interactions",
-            "clinical_warnings",
-            "recommendations"
-        ]
-        
-        if all(field in response for field in required_fields):
-            logger.info(f"{self.agent_name}: Analysis completed successfully")
-            return response
-        
-        logger.warning(f"{self.agent_name}: Incomplete response, using fallback")
-        return self._create_fallback_response(treatment_option)
-    
-    def _build_prompt(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        other_agent_outputs: Dict[str, Any]
-    ) -> str:
-        """Build safety analysis prompt."""
-        return f"""
-You are a clinical safety expert. Analyze the safety and contraindications for the following treatment plan.
-
-IMPORTANT: You are a SAFETY FLAGGING agent, NOT a decision-override agent. 
-Your role is to IDENTIFY and FLAG potential risks, contraindications, and safety concerns.
-You DO NOT make final treatment decisions.
-
-PATIENT SUMMARY (including comorbidities):
-{patient_summary}
-
-RECOMMENDED TREATMENT:
-{treatment_option}
-
-OTHER AGENT ASSESSMENTS:
-{self._format_agent_outputs(other_agent_outputs)}
-
-Provide a detailed safety assessment with the following JSON structure:
-
-{{
-  "safety_status": "<safe | caution | high-risk>",
-  "identified_contraindications": [
-    "<contraindication 1 with reason>",
-    "<contraindication 2 with reason>"
-  ],
-  "severity_score": <float 0-10, where 10 is most severe>,
-  "drug_interactions": [
-    "<interaction 1>",
-    "<interaction 2>"
-  ],
-  "clinical_warnings": [
-    "<warning 1>",
-    "<warning 2>"
-  ],
-  "recommendations": "<detailed safety recommendations and monitoring requirements>"
-}}
-
-Analyze:
-- Absolute contraindications (must not proceed)
-- Relative contraindications (proceed with caution)
-- Drug-drug interactions
-- Drug-disease interactions
-- Age-related contraindications
-- Organ dysfunction contraindications
-- Allergy risks
-- Monitoring requirements
-
-Respond ONLY with valid JSON.
-"""
-    
-    def _format_agent_outputs(self, outputs: Dict[str, Any]) -> str:
-        """Format other agent outputs for context."""
-        formatted = []
-        
-        if "surgical_agent" in outputs:
-            formatted.append(f"Surgical: {outputs['surgical_agent']}")
-        
-        if "chronic_care_agent" in outputs:
-            formatted.append(f"Chronic Care: {outputs['chronic_care_agent']}")
-        
-        if "risk_agent" in outputs:
-            formatted.append(f"Risk: {outputs['risk_agent']}")
-        
-        return "\n".join(formatted) if formatted else "No other agent data available"
-    
-    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
-        """Create fallback response when Gemini fails."""
-        return {
-            "safety_status": "high-risk" if error else "caution",
-            "identified_contraindications": [
-                f"Unable to assess contraindications due to system error - {treatment}"
-            ] if error else [
-                f"Standard safety review required for {treatment}"
-            ],
-            "severity_score": 8.0 if error else 5.0,
-            "drug_interactions": [
-                "System error - manual drug interaction check required"
-            ] if error else [
-                "Standard drug interaction screening recommended"
-            ],
-            "clinical_warnings": [
-                "CRITICAL: Safety assessment failed - manual clinical review REQUIRED before proceeding"
-            ] if error else [
-                "Standard clinical monitoring recommended"
-            ],
-            "recommendations": (
-                f"URGENT: Safety agent encountered an error analyzing {treatment}. "
-                "Do NOT proceed without manual clinical safety review by qualified healthcare provider."
-                if error
-                else f"Proceed with standard safety monitoring for {treatment}. "
-                "Verify patient-specific contraindications before treatment initiation."
-            )
-        }
+"""
+Safety and Contraindication Agent
+"""
+import asyncio
+import logging
+from typing import Dict, Any, List
+from services.gemini_client import GeminiClient
+from utils.json_guard import safe_get
+from utils.response_cache import make_cache_key, cache_get, cache_put, coalesce
+
+logger = logging.getLogger(__name__)
+
+# Longest patient summary forwarded into a safety prompt; anything beyond
+# this adds tokens (and latency) without adding screening signal
+_MAX_PATIENT_SUMMARY_CHARS = 4000
+
+# Static prompt scaffolding, hoisted to module constants so the builders
+# only assemble the dynamic middle (patient, treatment, upstream context)
+# per call instead of re-tokenizing the whole f-string
+_PROMPT_HEAD = """You are a clinical safety expert. Analyze the safety and contraindications for the following treatment plan.
+
+IMPORTANT: You are a SAFETY FLAGGING agent, NOT a decision-override agent.
+Your role is to IDENTIFY and FLAG potential risks, contraindications, and safety concerns.
+You DO NOT make final treatment decisions.
+"""
+
+_BATCH_PROMPT_HEAD = """You are a clinical safety expert. Analyze the safety and contraindications of EACH of the following treatment plans independently.
+
+IMPORTANT: You are a SAFETY FLAGGING agent, NOT a decision-override agent.
+Your role is to IDENTIFY and FLAG potential risks, contraindications, and safety concerns.
+You DO NOT make final treatment decisions.
+"""
+
+# Output structure is enforced by the response schema below, so the
+# prompt tails only carry the field guidance and clinical checklist
+_REPORT_GUIDANCE = """Report:
+- safety_status: safe/caution/high-risk
+- identified_contraindications: list of contraindications, each with its reason
+- severity_score: 0-10, where 10 is most severe
+- drug_interactions: list of drug interactions
+- clinical_warnings: list of clinical warnings
+- recommendations: detailed safety recommendations and monitoring requirements
+"""
+
+_ANALYSIS_CHECKLIST = """
+Analyze:
+- Absolute contraindications (must not proceed)
+- Relative contraindications (proceed with caution)
+- Drug-drug interactions
+- Drug-disease interactions
+- Age-related contraindications
+- Organ dysfunction contraindications
+- Allergy risks
+- Monitoring requirements
+"""
+
+_PROMPT_TAIL = "\n" + _REPORT_GUIDANCE + _ANALYSIS_CHECKLIST
+
+_BATCH_PROMPT_TAIL = (
+    '\nProduce one entry in "results" per treatment, in the same order the '
+    "treatments are listed.\n\nFor each treatment report:\n"
+    + _REPORT_GUIDANCE.partition("\n")[2]
+    + _ANALYSIS_CHECKLIST
+)
+
+# Gemini structured-output schema (OpenAPI subset, REST casing); the model
+# is forced to emit JSON matching this shape
+_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "safety_status": {
+            "type": "STRING",
+            "enum": ["safe", "caution", "high-risk"]
+        },
+        "identified_contraindications": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "severity_score": {"type": "NUMBER"},
+        "drug_interactions": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "clinical_warnings": {
+            "type": "ARRAY",
+            "items": {"type": "STRING"}
+        },
+        "recommendations": {"type": "STRING"}
+    },
+    "required": [
+        "safety_status",
+        "identified_contraindications",
+        "severity_score",
+        "drug_interactions",
+        "clinical_warnings",
+        "recommendations"
+    ]
+}
+
+_BATCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "results": {
+            "type": "ARRAY",
+            "items": _RESPONSE_SCHEMA
+        }
+    },
+    "required": ["results"]
+}
+
+# Deterministic assessment for cases the fast-path gate deems clearly
+# safe; returning it skips a full Gemini round-trip
+_FAST_PATH_RESPONSE = {
+    "safety_status": "safe",
+    "identified_contraindications": [],
+    "severity_score": 1.0,
+    "drug_interactions": [],
+    "clinical_warnings": [
+        "Standard clinical monitoring recommended"
+    ],
+    "recommendations": (
+        "Low-risk profile across upstream assessments. Proceed with standard "
+        "safety monitoring and verify patient-specific contraindications at "
+        "treatment initiation."
+    )
+}
+
+# Fallback payloads built once at import; per-call work is a shallow copy
+# plus interpolating the treatment into the fields that embed it. The
+# identified_contraindications entry is stored as a bare string template
+# and wrapped into its single-element list at copy time
+_FALLBACK_ERROR_TEMPLATE = {
+    "safety_status": "high-risk",
+    "identified_contraindications":
+        "Unable to assess contraindications due to system error - {treatment}",
+    "severity_score": 8.0,
+    "drug_interactions": [
+        "System error - manual drug interaction check required"
+    ],
+    "clinical_warnings": [
+        "CRITICAL: Safety assessment failed - manual clinical review REQUIRED before proceeding"
+    ],
+    "recommendations": (
+        "URGENT: Safety agent encountered an error analyzing {treatment}. "
+        "Do NOT proceed without manual clinical safety review by qualified healthcare provider."
+    )
+}
+
+_FALLBACK_CAUTION_TEMPLATE = {
+    "safety_status": "caution",
+    "identified_contraindications": "Standard safety review required for {treatment}",
+    "severity_score": 5.0,
+    "drug_interactions": [
+        "Standard drug interaction screening recommended"
+    ],
+    "clinical_warnings": [
+        "Standard clinical monitoring recommended"
+    ],
+    "recommendations": (
+        "Proceed with standard safety monitoring for {treatment}. "
+        "Verify patient-specific contraindications before treatment initiation."
+    )
+}
+
+
+class SafetyContraindicationAgent:
+    """
+    Agent responsible for identifying safety issues and contraindications.
+    This agent DOES NOT override decisions, only FLAGS potential risks.
+    """
+
+    # Fixed attribute layout: skips the per-instance __dict__ and makes
+    # attribute access a slot lookup on the agent hot path
+    __slots__ = ("gemini", "agent_name")
+
+    # Largest number of treatments screened in one Gemini call; bigger
+    # batches are split so latency stays on the flat part of the curve
+    MAX_BATCH = 8
+
+    REQUIRED_FIELDS = [
+        "safety_status",
+        "identified_contraindications",
+        "severity_score",
+        "drug_interactions",
+        "clinical_warnings",
+        "recommendations"
+    ]
+
+    # Frozenset view for C-level subset checks on the response hot path
+    _REQUIRED = frozenset(REQUIRED_FIELDS)
+
+    def __init__(self, gemini_client: GeminiClient):
+        """
+        Initialize Safety Contraindication Agent.
+        
+        Args:
+            gemini_client: Configured Gemini client instance
+        """
+        self.gemini = gemini_client
+        self.agent_name = "Safety Contraindication Agent"
+    
+    async def analyze(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        other_agent_outputs: Dict[str, Any],
+        patient_cache: str = None
+    ) -> Dict[str, Any]:
+        """
+        Identify safety concerns and contraindications for treatment.
+
+        Args:
+            patient_summary: Patient clinical summary with comorbidities
+            treatment_option: Recommended treatment path
+            other_agent_outputs: Outputs from surgical, chronic care, and risk agents
+            patient_cache: Optional cachedContents resource holding the
+                patient summary, shared across all agents in one request
+
+        Returns:
+            Safety assessment with contraindications and warnings
+        """
+        logger.info("%s: Analyzing safety for: %s", self.agent_name, treatment_option)
+
+        if self._is_clearly_safe(other_agent_outputs):
+            logger.info("%s: Safety fast-path taken", self.agent_name)
+            return dict(_FAST_PATH_RESPONSE)
+
+        # Key includes the upstream agent outputs: a change in any of them
+        # must invalidate the cached safety assessment
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, treatment_option, other_agent_outputs
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        prompt = self._build_prompt(
+            patient_summary,
+            treatment_option,
+            other_agent_outputs,
+            patient_cached=bool(patient_cache)
+        )
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a clinical safety and contraindication expert AI assistant.",
+            cached_content=patient_cache,
+            response_schema=_RESPONSE_SCHEMA
+        ))
+        
+        # Handle error responses
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return self._create_fallback_response(treatment_option, error=True)
+        
+        # Validate required fields
+        if response.keys() >= self._REQUIRED:
+            logger.info("%s: Analysis completed successfully", self.agent_name)
+            cache_put(cache_key, response)
+            return response
+        
+        logger.warning("%s: Incomplete response, using fallback", self.agent_name)
+        return self._create_fallback_response(treatment_option)
+
+    async def analyze_batch(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        other_agent_outputs_list: List[Dict[str, Any]],
+        patient_cache: str = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Screen several treatments for safety in a single Gemini call.
+
+        Amortizes the shared prompt prefix and one network round-trip
+        across all treatments instead of paying them per treatment.
+
+        Args:
+            patient_summary: Patient clinical summary with comorbidities
+            treatments: Treatment options to screen
+            other_agent_outputs_list: Upstream agent outputs, one dict
+                per treatment, in the same order as treatments
+            patient_cache: Optional cachedContents resource holding the
+                patient summary, shared across all agents in one request
+
+        Returns:
+            One safety assessment per treatment, in input order
+        """
+        logger.info("%s: Batch screening %d treatments", self.agent_name, len(treatments))
+
+        # Only short-circuit when every treatment passes the gate; a mixed
+        # batch still goes to Gemini as one call
+        if all(self._is_clearly_safe(outputs) for outputs in other_agent_outputs_list):
+            logger.info("%s: Safety fast-path taken for batch", self.agent_name)
+            return [dict(_FAST_PATH_RESPONSE) for _ in treatments]
+
+        if len(treatments) > self.MAX_BATCH:
+            # Split oversized batches and run the chunks concurrently
+            chunk_results = await asyncio.gather(*(
+                self.analyze_batch(
+                    patient_summary,
+                    treatments[i:i + self.MAX_BATCH],
+                    other_agent_outputs_list[i:i + self.MAX_BATCH],
+                    patient_cache=patient_cache
+                )
+                for i in range(0, len(treatments), self.MAX_BATCH)
+            ))
+            return [entry for chunk in chunk_results for entry in chunk]
+
+        # Key includes the upstream agent outputs: a change in any of them
+        # must invalidate the cached safety assessments
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, tuple(treatments), other_agent_outputs_list
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        prompt = self._build_batch_prompt(
+            patient_summary,
+            treatments,
+            other_agent_outputs_list,
+            patient_cached=bool(patient_cache)
+        )
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a clinical safety and contraindication expert AI assistant.",
+            cached_content=patient_cache,
+            response_schema=_BATCH_RESPONSE_SCHEMA
+        ))
+
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return [
+                self._create_fallback_response(t, error=True) for t in treatments
+            ]
+
+        results = response.get("results")
+        if not isinstance(results, list) or len(results) != len(treatments):
+            logger.warning("%s: Malformed batch response, using fallbacks", self.agent_name)
+            return [self._create_fallback_response(t) for t in treatments]
+
+        validated = []
+        used_fallback = False
+        for treatment, entry in zip(treatments, results):
+            if isinstance(entry, dict) and entry.keys() >= self._REQUIRED:
+                validated.append(entry)
+            else:
+                logger.warning("%s: Incomplete batch entry, using fallback", self.agent_name)
+                validated.append(self._create_fallback_response(treatment))
+                used_fallback = True
+
+        logger.info("%s: Batch screening completed successfully", self.agent_name)
+        if not used_fallback:
+            cache_put(cache_key, validated)
+        return validated
+
+    @staticmethod
+    def _is_clearly_safe(other_agent_outputs: Dict[str, Any]) -> bool:
+        """
+        Gate for the deterministic fast path.
+
+        True only when the upstream signals are unambiguous: minimally
+        invasive surgery, low anesthesia risk, near-zero complication
+        probability and low readmission risk. Any missing or malformed
+        signal fails the gate, so the default remains a full screen.
+        """
+        surgical = other_agent_outputs.get("surgical_agent") or {}
+        risk = other_agent_outputs.get("risk_agent") or {}
+        try:
+            return (
+                float(surgical.get("invasiveness_score", 10)) < 2
+                and surgical.get("anesthesia_risk") == "low"
+                and float(risk.get("complication_probability", 1)) < 0.1
+                and risk.get("readmission_risk") == "low"
+            )
+        except (TypeError, ValueError):
+            return False
+
+    def _build_prompt(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        other_agent_outputs: Dict[str, Any],
+        patient_cached: bool = False
+    ) -> str:
+        """Build safety analysis prompt (static head/tail plus dynamic middle)."""
+        return "".join((
+            _PROMPT_HEAD,
+            # When the patient summary lives in the per-request cache, omit
+            # it from the prompt - the cache already carries it
+            "" if patient_cached
+            else f"\nPATIENT SUMMARY (including comorbidities):\n{patient_summary[:_MAX_PATIENT_SUMMARY_CHARS]}\n",
+            "\nRECOMMENDED TREATMENT:\n", treatment_option,
+            "\n\nOTHER AGENT ASSESSMENTS:\n",
+            self._format_agent_outputs(other_agent_outputs),
+            "\n", _PROMPT_TAIL
+        ))
+
+    def _build_batch_prompt(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        other_agent_outputs_list: List[Dict[str, Any]],
+        patient_cached: bool = False
+    ) -> str:
+        """Build batch safety analysis prompt covering all treatments in one call."""
+        treatment_blocks = "\n\n".join(
+            f"{i}. {treatment}\n"
+            f"OTHER AGENT ASSESSMENTS:\n{self._format_agent_outputs(outputs)}"
+            for i, (treatment, outputs) in enumerate(
+                zip(treatments, other_agent_outputs_list), start=1
+            )
+        )
+        return "".join((
+            _BATCH_PROMPT_HEAD,
+            # When the patient summary lives in the per-request cache, omit
+            # it from the prompt - the cache already carries it
+            "" if patient_cached
+            else f"\nPATIENT SUMMARY (including comorbidities):\n{patient_summary[:_MAX_PATIENT_SUMMARY_CHARS]}\n",
+            "\nRECOMMENDED TREATMENTS:\n", treatment_blocks,
+            "\n", _BATCH_PROMPT_TAIL
+        ))
+
+    def _format_agent_outputs(self, outputs: Dict[str, Any]) -> str:
+        """
+        Compact the upstream outputs to the fields safety screening uses.
+
+        Embedding the raw upstream dicts pushed multi-KB JSON dumps (full
+        insights prose included) into every safety prompt; token count
+        drives Gemini latency roughly linearly, so only a whitelisted
+        handful of signals is forwarded as one line per agent.
+        """
+        formatted = []
+
+        surgical = outputs.get("surgical_agent")
+        if surgical:
+            formatted.append(
+                "Surgical: feasibility={}, invasiveness={}, complexity={}, anesthesia={}".format(
+                    surgical.get("surgical_feasibility", "unknown"),
+                    surgical.get("invasiveness_score", "unknown"),
+                    surgical.get("procedural_complexity", "unknown"),
+                    surgical.get("anesthesia_risk", "unknown")
+                )
+            )
+
+        chronic = outputs.get("chronic_care_agent")
+        if chronic:
+            formatted.append(
+                "Chronic Care: medication_burden={}, lifestyle_impact={}, stability={}".format(
+                    chronic.get("medication_burden_score", "unknown"),
+                    chronic.get("lifestyle_impact", "unknown"),
+                    chronic.get("disease_stability", "unknown")
+                )
+            )
+
+        risk = outputs.get("risk_agent")
+        if risk:
+            formatted.append(
+                "Risk: complication_probability={}, readmission={}, uncertainty={}".format(
+                    risk.get("complication_probability", "unknown"),
+                    risk.get("readmission_risk", "unknown"),
+                    risk.get("uncertainty_level", "unknown")
+                )
+            )
+
+        return "\n".join(formatted) if formatted else "No other agent data available"
+    
+    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
+        """Create fallback response when Gemini fails."""
+        response = (_FALLBACK_ERROR_TEMPLATE if error else _FALLBACK_CAUTION_TEMPLATE).copy()
+        response["identified_contraindications"] = [
+            response["identified_contraindications"].format(treatment=treatment)
+        ]
+        response["recommendations"] = response["recommendations"].format(treatment=treatment)
+        return response
@@ -0,0 +1,8 @@
+"""Services package"""
+from .gemini_client import GeminiClient, create_http_client, get_shared_http_client
+
+__all__ = [
+    "GeminiClient",
+    "create_http_client",
+    "get_shared_http_client"
+]
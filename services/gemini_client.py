@@ -0,0 +1,405 @@
+"""
+Reusable Gemini API Client
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional
+
+import httpx
+import orjson
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential_jitter
+)
+
+from utils.json_guard import extract_json
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_MODEL = "gemini-1.5-pro"
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_QPM = 500
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """Transient failures worth retrying: timeouts and 5xx responses."""
+    if isinstance(exc, httpx.TimeoutException):
+        return True
+    return (
+        isinstance(exc, httpx.HTTPStatusError)
+        and exc.response.status_code >= 500
+    )
+
+
+class CircuitBreaker:
+    """
+    Minimal consecutive-failure circuit breaker.
+
+    After fail_max consecutive failures the breaker opens and callers
+    short-circuit to their fallbacks without paying the API round-trip.
+    Once reset_timeout has elapsed the next call is let through as a
+    probe; a success closes the breaker again.
+    """
+
+    def __init__(self, fail_max: int = 5, reset_timeout: float = 30.0):
+        """
+        Initialize the breaker.
+
+        Args:
+            fail_max: Consecutive failures before the breaker opens
+            reset_timeout: Seconds the breaker stays open before probing
+        """
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+
+    def is_open(self) -> bool:
+        """Whether calls should be short-circuited right now."""
+        if self._failures < self.fail_max:
+            return False
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            # Half-open: let one probe call through
+            self._failures = self.fail_max - 1
+            return False
+        return True
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call."""
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        """Count a failure; opens the breaker at fail_max."""
+        self._failures += 1
+        if self._failures >= self.fail_max:
+            self._opened_at = time.monotonic()
+
+
+def create_http_client(timeout: float = DEFAULT_TIMEOUT) -> httpx.AsyncClient:
+    """
+    Create a pooled HTTP/2 client suitable for sharing across Gemini calls.
+
+    Args:
+        timeout: Request timeout in seconds
+
+    Returns:
+        Configured httpx.AsyncClient with keep-alive connection pooling
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_keepalive_connections=32,
+            max_connections=64
+        ),
+        timeout=timeout
+    )
+
+
+# Lazily-created fallback pool shared by every GeminiClient constructed
+# without an injected client, so ad-hoc instances still amortize TLS/TCP
+# setup across one another instead of each opening their own pool
+_shared_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_shared_http_client() -> httpx.AsyncClient:
+    """
+    Return the lazily-created module-level shared HTTP client.
+
+    Returns:
+        The shared pooled httpx.AsyncClient, created on first use
+    """
+    global _shared_http_client
+    if _shared_http_client is None or _shared_http_client.is_closed:
+        _shared_http_client = create_http_client()
+    return _shared_http_client
+
+
+class GeminiClient:
+    """
+    Async client for the Gemini generateContent API.
+
+    Wraps the REST endpoint and guarantees a dictionary response:
+    either the parsed JSON payload from the model, or a dictionary
+    containing an "error" key that agents handle via their fallbacks.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        """
+        Initialize Gemini client.
+
+        Args:
+            model_name: Gemini model to use (defaults to GEMINI_MODEL env var)
+            http_client: Shared httpx.AsyncClient to reuse across calls.
+                If omitted, the client creates (and owns) its own.
+
+        Raises:
+            ValueError: If GEMINI_API_KEY is not configured
+        """
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            raise ValueError(
+                "GEMINI_API_KEY environment variable is not set. "
+                "Add it to your .env file."
+            )
+
+        self.model_name = model_name or os.getenv("GEMINI_MODEL", DEFAULT_MODEL)
+        self.timeout = float(os.getenv("GEMINI_TIMEOUT", DEFAULT_TIMEOUT))
+
+        # Endpoint URLs are fixed for the life of the client; build once
+        # instead of formatting them on every call
+        self._generate_url = (
+            f"{GEMINI_API_BASE}/models/{self.model_name}:generateContent"
+            f"?key={self.api_key}"
+        )
+        self._cache_url = f"{GEMINI_API_BASE}/cachedContents?key={self.api_key}"
+
+        # Reuse one pooled connection across all calls so each request
+        # doesn't pay TCP + TLS handshake overhead. Every GeminiClient
+        # must share a pool: the app lifespan injects its client into all
+        # instances, and uninjected instances fall back to the module-
+        # level shared client rather than opening a pool of their own.
+        self._client = http_client or get_shared_http_client()
+
+        # Generation configs are identical across calls, so build them once;
+        # per-call code only attaches contents (and a schema when given)
+        # instead of rebuilding the config dict on every request
+        self._base_generation_config: Dict[str, Any] = {
+            "temperature": 0.2
+        }
+        self._json_generation_config: Dict[str, Any] = {
+            "temperature": 0.2,
+            "responseMimeType": "application/json"
+        }
+
+        # Short-circuits calls during a sustained Gemini outage so agents
+        # fall back immediately instead of stacking timeouts
+        self._breaker = CircuitBreaker(fail_max=5, reset_timeout=30.0)
+
+        # Cap concurrent generateContent calls to the project's QPM tier
+        # (spread per second) so bursty gather() fan-outs queue locally
+        # instead of tripping 429s and degrading into retry storms
+        qpm = int(os.getenv("GEMINI_QPM", DEFAULT_QPM))
+        self._semaphore = asyncio.Semaphore(max(1, qpm // 60))
+
+        logger.info("GeminiClient configured for model: %s", self.model_name)
+
+    async def aclose(self) -> None:
+        """
+        Close the module-level shared client, if this instance uses it.
+
+        Injected clients belong to their creator (the app lifespan) and
+        are left untouched.
+        """
+        global _shared_http_client
+        if self._client is _shared_http_client and _shared_http_client is not None:
+            await _shared_http_client.aclose()
+            _shared_http_client = None
+
+    async def warm_up(self) -> None:
+        """
+        Pre-warm the connection path to the Gemini API.
+
+        Fetches the model's metadata (a free endpoint) so DNS resolution,
+        the TLS handshake, and HTTP/2 session setup happen at startup
+        instead of on the first simulation request. Failures are logged
+        and ignored; the first real call then simply pays the setup cost.
+        """
+        url = f"{GEMINI_API_BASE}/models/{self.model_name}?key={self.api_key}"
+        try:
+            response = await self._client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("Gemini connection pre-warm failed: %s", str(e))
+            return
+        logger.info("Gemini connection pre-warmed for model: %s", self.model_name)
+
+    async def generate_json_response(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        cached_content: Optional[str] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Call Gemini and parse the response as JSON.
+
+        Args:
+            prompt: User prompt text
+            system_instruction: Optional system instruction for the model
+            cached_content: Optional cachedContents resource name holding the
+                stable prompt prefix (system instruction included), so only
+                the dynamic tail is sent and processed per call
+            response_schema: Optional structured-output schema (OpenAPI
+                subset); when set, Gemini is forced to emit JSON conforming
+                to the schema instead of free text
+
+        Returns:
+            Parsed JSON dictionary, or {"error": ...} on any failure
+        """
+        if self._breaker.is_open():
+            logger.warning("Gemini circuit breaker open, skipping API call")
+            return {"error": "Gemini circuit breaker open"}
+
+        if response_schema:
+            generation_config = {
+                **self._json_generation_config,
+                "responseSchema": response_schema
+            }
+        else:
+            generation_config = self._base_generation_config
+
+        payload: Dict[str, Any] = {
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [{"text": prompt}]
+                }
+            ],
+            "generationConfig": generation_config
+        }
+
+        if cached_content:
+            # The cache already carries the system instruction and scaffolding
+            payload["cachedContent"] = cached_content
+        elif system_instruction:
+            payload["systemInstruction"] = {
+                "parts": [{"text": system_instruction}]
+            }
+
+        try:
+            async with self._semaphore:
+                response = await self._post_with_retry(self._generate_url, payload)
+            data = orjson.loads(response.content)
+        except httpx.HTTPStatusError as e:
+            self._breaker.record_failure()
+            logger.error("Gemini API returned %s", e.response.status_code)
+            return {"error": f"Gemini API error: {e.response.status_code}"}
+        except httpx.HTTPError as e:
+            self._breaker.record_failure()
+            logger.error("Gemini API request failed: %s", str(e))
+            return {"error": f"Gemini API request failed: {str(e)}"}
+        except orjson.JSONDecodeError as e:
+            # A 200 whose body is not JSON (gateway splash page, truncated
+            # response) still violates the dict-response contract
+            self._breaker.record_failure()
+            logger.error("Gemini API returned a non-JSON body: %s", str(e))
+            return {"error": f"Gemini API returned a non-JSON body: {str(e)}"}
+
+        self._breaker.record_success()
+        text = self._extract_text(data)
+        if text is None:
+            return {"error": "Gemini response contained no candidates"}
+
+        return extract_json(text)
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential_jitter(initial=0.1, max=2.0),
+        retry=retry_if_exception(_is_retryable),
+        reraise=True
+    )
+    async def _post_with_retry(
+        self,
+        url: str,
+        payload: Dict[str, Any]
+    ) -> httpx.Response:
+        """
+        POST a payload, retrying transient failures with jittered backoff.
+
+        Timeouts and 5xx responses are retried up to twice; 4xx responses
+        and other errors are raised immediately.
+        """
+        response = await self._client.post(url, json=payload)
+        response.raise_for_status()
+        return response
+
+    async def create_cached_content(
+        self,
+        content_text: str,
+        system_instruction: Optional[str] = None,
+        ttl: str = "3600s"
+    ) -> Optional[str]:
+        """
+        Create a server-side cachedContents resource for a stable prompt prefix.
+
+        The cached prefix is processed (and billed) once, then reused by every
+        generateContent call that references it.
+
+        Args:
+            content_text: Stable prompt text to cache
+            system_instruction: Optional system instruction baked into the cache
+            ttl: Cache lifetime (e.g. "3600s")
+
+        Returns:
+            The cachedContents resource name, or None if caching failed
+            (callers should fall back to sending the full prompt)
+        """
+        payload: Dict[str, Any] = {
+            "model": f"models/{self.model_name}",
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [{"text": content_text}]
+                }
+            ],
+            "ttl": ttl
+        }
+
+        if system_instruction:
+            payload["systemInstruction"] = {
+                "parts": [{"text": system_instruction}]
+            }
+
+        try:
+            response = await self._client.post(self._cache_url, json=payload)
+            response.raise_for_status()
+            name = response.json().get("name")
+        except httpx.HTTPError as e:
+            logger.warning("Prompt cache creation failed, continuing uncached: %s", str(e))
+            return None
+
+        if name:
+            logger.info("Created prompt cache: %s", name)
+        return name
+
+    async def delete_cached_content(self, name: str) -> None:
+        """
+        Delete a cachedContents resource.
+
+        Args:
+            name: Resource name returned by create_cached_content
+        """
+        url = f"{GEMINI_API_BASE}/{name}?key={self.api_key}"
+
+        try:
+            response = await self._client.delete(url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            logger.warning("Failed to delete prompt cache %s: %s", name, str(e))
+
+    def check_health(self) -> bool:
+        """
+        Lightweight health check for the Gemini configuration.
+
+        Returns:
+            True if the client is configured with an API key
+        """
+        return bool(self.api_key)
+
+    @staticmethod
+    def _extract_text(data: Dict[str, Any]) -> Optional[str]:
+        """Pull the first candidate's text out of a generateContent response."""
+        try:
+            return data["candidates"][0]["content"]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            logger.warning("Unexpected Gemini response structure")
+            return None
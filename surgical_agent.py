@@ -1,127 +1,347 @@
-"""
-Surgical Planning Agent
-"""
-import logging
-from typing import Dict, Any
-from services.gemini_client import GeminiClient
-from utils.json_guard import safe_get
-
-logger = logging.getLogger(__name__)
-
-
-class SurgicalPlanningAgent:
-    """
-    Agent responsible for surgical feasibility and planning analysis.
-    """
-    
-    def __init__(self, gemini_client: GeminiClient):
-        """
-        Initialize Surgical Planning Agent.
-        
-        Args:
-            gemini_client: Configured Gemini client instance
-        """
-        self.gemini = gemini_client
-        self.agent_name = "Surgical Planning Agent"
-    
-    def analyze(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        simulation_horizon: int
-    ) -> Dict[str, Any]:
-        """
-        Analyze surgical feasibility for given treatment.
-        
-        Args:
-            patient_summary: Patient clinical summary
-            treatment_option: Treatment to analyze
-            simulation_horizon: Days to simulate
-        
-        Returns:
-            Surgical analysis results
-        """
-        logger.info(f"{self.agent_name}: Analyzing treatment: {treatment_option}")
-        
-        prompt = self._build_prompt(patient_summary, treatment_option, simulation_horizon)
-        
-        response = self.gemini.generate_json_response(
-            prompt=prompt,
-            system_instruction="You are a surgical planning expert AI assistant."
-        )
-        
-        # Handle error responses
-        if safe_get(response, "error"):
-            logger.error(f"{self.agent_name}: {response.get('error')}")
-            return self._create_fallback_response(treatment_option, error=True)
-        
-        # Validate required fields
-        required_fields = [
-            "surgical_feasibility",
-            "invasiveness_score",
-            "recovery_time_days",
-            "procedural_complexity",
-            "anesthesia_risk",
-            "insights"
-        ]
-        
-        if all(field in response for field in required_fields):
-            logger.info(f"{self.agent_name}: Analysis completed successfully")
-            return response
-        
-        logger.warning(f"{self.agent_name}: Incomplete response, using fallback")
-        return self._create_fallback_response(treatment_option)
-    
-    def _build_prompt(
-        self,
-        patient_summary: str,
-        treatment_option: str,
-        simulation_horizon: int
-    ) -> str:
-        """Build analysis prompt."""
-        return f"""
-You are a surgical planning expert. Analyze the surgical feasibility of the following treatment.
-
-PATIENT SUMMARY:
-{patient_summary}
-
-TREATMENT OPTION:
-{treatment_option}
-
-SIMULATION HORIZON: {simulation_horizon} days
-
-Provide a detailed surgical analysis with the following JSON structure:
-
-{{
-  "surgical_feasibility": "<high/moderate/low/not-applicable>",
-  "invasiveness_score": <float 0-10, where 10 is most invasive>,
-  "recovery_time_days": <integer estimated recovery days>,
-  "procedural_complexity": "<low/moderate/high/very-high>",
-  "anesthesia_risk": "<low/moderate/high>",
-  "insights": "<detailed explanation of surgical considerations, techniques, and expected outcomes>"
-}}
-
-Consider:
-- Patient's age, comorbidities, and overall health status
-- Surgical technique requirements
-- Expected blood loss and complications
-- Post-operative care needs
-- Recovery timeline and rehabilitation
-
-Respond ONLY with valid JSON.
-"""
-    
-    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
-        """Create fallback response when Gemini fails."""
-        return {
-            "surgical_feasibility": "unknown" if error else "moderate",
-            "invasiveness_score": 0.0 if error else 5.0,
-            "recovery_time_days": 0 if error else 30,
-            "procedural_complexity": "unknown" if error else "moderate",
-            "anesthesia_risk": "unknown" if error else "moderate",
-            "insights": (
-                f"Error analyzing surgical feasibility for {treatment}. Manual review required."
-                if error
-                else f"Standard surgical analysis for {treatment}. Further evaluation recommended."
-            )
-        }
+"""
+Surgical Planning Agent
+"""
+import asyncio
+import logging
+from typing import Dict, Any, List
+from services.gemini_client import GeminiClient
+from utils.json_guard import safe_get
+from utils.response_cache import make_cache_key, cache_get, cache_put, coalesce
+from utils.semantic_cache import semantic_get, semantic_put
+
+logger = logging.getLogger(__name__)
+
+# Static prompt scaffolding, hoisted to module constants so the builders
+# only assemble the small dynamic tail per call instead of re-tokenizing
+# the whole multi-hundred-byte f-string. Output structure is enforced by
+# the response schema below, so the prompt only carries the clinical
+# guidance.
+_PROMPT_SCAFFOLD = """You are a surgical planning expert. Analyze the surgical feasibility of a proposed treatment.
+
+Report:
+- surgical_feasibility: high/moderate/low/not-applicable
+- invasiveness_score: 0-10, where 10 is most invasive
+- recovery_time_days: integer estimated recovery days
+- procedural_complexity: low/moderate/high/very-high
+- anesthesia_risk: low/moderate/high
+- insights: detailed explanation of surgical considerations, techniques, and expected outcomes
+
+Consider:
+- Patient's age, comorbidities, and overall health status
+- Surgical technique requirements
+- Expected blood loss and complications
+- Post-operative care needs
+- Recovery timeline and rehabilitation
+
+Analyze the patient and treatment described below.
+"""
+
+_BATCH_PROMPT_SCAFFOLD = """You are a surgical planning expert. Analyze the surgical feasibility of EACH of the following treatments independently, producing one entry in "results" per treatment, in the same order the treatments are listed.
+
+For each treatment report:
+- surgical_feasibility: high/moderate/low/not-applicable
+- invasiveness_score: 0-10, where 10 is most invasive
+- recovery_time_days: integer estimated recovery days
+- procedural_complexity: low/moderate/high/very-high
+- anesthesia_risk: low/moderate/high
+- insights: detailed explanation of surgical considerations, techniques, and expected outcomes
+
+Consider:
+- Patient's age, comorbidities, and overall health status
+- Surgical technique requirements
+- Expected blood loss and complications
+- Post-operative care needs
+- Recovery timeline and rehabilitation
+
+Analyze the patient and treatments described below.
+"""
+
+# Gemini structured-output schema (OpenAPI subset, REST casing); the model
+# is forced to emit JSON matching this shape
+_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "surgical_feasibility": {
+            "type": "STRING",
+            "enum": ["high", "moderate", "low", "not-applicable"]
+        },
+        "invasiveness_score": {"type": "NUMBER"},
+        "recovery_time_days": {"type": "INTEGER"},
+        "procedural_complexity": {
+            "type": "STRING",
+            "enum": ["low", "moderate", "high", "very-high"]
+        },
+        "anesthesia_risk": {
+            "type": "STRING",
+            "enum": ["low", "moderate", "high"]
+        },
+        "insights": {"type": "STRING"}
+    },
+    "required": [
+        "surgical_feasibility",
+        "invasiveness_score",
+        "recovery_time_days",
+        "procedural_complexity",
+        "anesthesia_risk",
+        "insights"
+    ]
+}
+
+_BATCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "results": {
+            "type": "ARRAY",
+            "items": _RESPONSE_SCHEMA
+        }
+    },
+    "required": ["results"]
+}
+
+# Fallback payloads built once at import; per-call work is a shallow copy
+# plus interpolating the treatment into the fields that embed it. Under a
+# partial Gemini outage the fallback path is hot, so it shouldn't rebuild
+# the whole dict each time
+_FALLBACK_ERROR_TEMPLATE = {
+    "surgical_feasibility": "unknown",
+    "invasiveness_score": 0.0,
+    "recovery_time_days": 0,
+    "procedural_complexity": "unknown",
+    "anesthesia_risk": "unknown",
+    "insights": "Error analyzing surgical feasibility for {treatment}. Manual review required."
+}
+
+_FALLBACK_CAUTION_TEMPLATE = {
+    "surgical_feasibility": "moderate",
+    "invasiveness_score": 5.0,
+    "recovery_time_days": 30,
+    "procedural_complexity": "moderate",
+    "anesthesia_risk": "moderate",
+    "insights": "Standard surgical analysis for {treatment}. Further evaluation recommended."
+}
+
+
+class SurgicalPlanningAgent:
+    """
+    Agent responsible for surgical feasibility and planning analysis.
+    """
+
+    # Fixed attribute layout: skips the per-instance __dict__ and makes
+    # attribute access a slot lookup on the agent hot path
+    __slots__ = ("gemini", "agent_name")
+
+    REQUIRED_FIELDS = [
+        "surgical_feasibility",
+        "invasiveness_score",
+        "recovery_time_days",
+        "procedural_complexity",
+        "anesthesia_risk",
+        "insights"
+    ]
+
+    # Frozenset view for C-level subset checks on the response hot path
+    _REQUIRED = frozenset(REQUIRED_FIELDS)
+
+    # Largest number of treatments analyzed in one Gemini call; bigger
+    # batches are split so latency stays on the flat part of the curve
+    MAX_BATCH = 8
+    
+    def __init__(self, gemini_client: GeminiClient):
+        """
+        Initialize Surgical Planning Agent.
+        
+        Args:
+            gemini_client: Configured Gemini client instance
+        """
+        self.gemini = gemini_client
+        self.agent_name = "Surgical Planning Agent"
+    
+    async def analyze(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int
+    ) -> Dict[str, Any]:
+        """
+        Analyze surgical feasibility for given treatment.
+        
+        Args:
+            patient_summary: Patient clinical summary
+            treatment_option: Treatment to analyze
+            simulation_horizon: Days to simulate
+        
+        Returns:
+            Surgical analysis results
+        """
+        logger.info("%s: Analyzing treatment: %s", self.agent_name, treatment_option)
+
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, treatment_option, simulation_horizon
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        semantic_text = f"{patient_summary}\n{treatment_option}\nhorizon={simulation_horizon}"
+        # Namespace by call shape: single and batch responses have
+        # different types, and the shared patient summary dominates the
+        # embedding enough for the two to cross-hit otherwise
+        semantic_namespace = f"{self.agent_name}:single"
+        semantic_hit = semantic_get(semantic_namespace, semantic_text)
+        if semantic_hit is not None:
+            return semantic_hit
+
+        prompt = self._build_prompt(patient_summary, treatment_option, simulation_horizon)
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a surgical planning expert AI assistant.",
+            response_schema=_RESPONSE_SCHEMA
+        ))
+        
+        # Handle error responses
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return self._create_fallback_response(treatment_option, error=True)
+        
+        # Validate required fields
+        if response.keys() >= self._REQUIRED:
+            logger.info("%s: Analysis completed successfully", self.agent_name)
+            cache_put(cache_key, response)
+            semantic_put(semantic_namespace, semantic_text, response)
+            return response
+
+        logger.warning("%s: Incomplete response, using fallback", self.agent_name)
+        return self._create_fallback_response(treatment_option)
+
+    async def analyze_batch(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        simulation_horizon: int,
+        patient_cache: str = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyze several treatments in a single Gemini call.
+
+        Amortizes the shared prompt prefix and one network round-trip
+        across all treatments instead of paying them per treatment.
+
+        Args:
+            patient_summary: Patient clinical summary
+            treatments: Treatment options to analyze
+            simulation_horizon: Days to simulate
+            patient_cache: Optional cachedContents resource holding the
+                patient summary, shared across all agents in one request
+
+        Returns:
+            One analysis result per treatment, in input order
+        """
+        logger.info("%s: Batch analyzing %d treatments", self.agent_name, len(treatments))
+
+        if len(treatments) > self.MAX_BATCH:
+            # Split oversized batches and run the chunks concurrently
+            chunk_results = await asyncio.gather(*(
+                self.analyze_batch(
+                    patient_summary,
+                    treatments[i:i + self.MAX_BATCH],
+                    simulation_horizon,
+                    patient_cache=patient_cache
+                )
+                for i in range(0, len(treatments), self.MAX_BATCH)
+            ))
+            return [entry for chunk in chunk_results for entry in chunk]
+
+        cache_key = make_cache_key(
+            self.agent_name, patient_summary, tuple(treatments), simulation_horizon
+        )
+        cached = cache_get(cache_key)
+        if cached is not None:
+            return cached
+
+        semantic_text = "\n".join([patient_summary, *treatments, f"horizon={simulation_horizon}"])
+        # Namespaced by shape and size so a hit always carries one entry
+        # per requested treatment (see the single-call path)
+        semantic_namespace = f"{self.agent_name}:batch:{len(treatments)}"
+        semantic_hit = semantic_get(semantic_namespace, semantic_text)
+        if semantic_hit is not None:
+            return semantic_hit
+
+        prompt = self._build_batch_prompt(
+            patient_summary, treatments, simulation_horizon,
+            patient_cached=bool(patient_cache)
+        )
+
+        response = await coalesce(cache_key, lambda: self.gemini.generate_json_response(
+            prompt=prompt,
+            system_instruction="You are a surgical planning expert AI assistant.",
+            cached_content=patient_cache,
+            response_schema=_BATCH_RESPONSE_SCHEMA
+        ))
+
+        if safe_get(response, "error"):
+            logger.error("%s: %s", self.agent_name, response.get("error"))
+            return [
+                self._create_fallback_response(t, error=True) for t in treatments
+            ]
+
+        results = response.get("results")
+        if not isinstance(results, list) or len(results) != len(treatments):
+            logger.warning("%s: Malformed batch response, using fallbacks", self.agent_name)
+            return [self._create_fallback_response(t) for t in treatments]
+
+        validated = []
+        used_fallback = False
+        for treatment, entry in zip(treatments, results):
+            if isinstance(entry, dict) and entry.keys() >= self._REQUIRED:
+                validated.append(entry)
+            else:
+                logger.warning("%s: Incomplete batch entry, using fallback", self.agent_name)
+                validated.append(self._create_fallback_response(treatment))
+                used_fallback = True
+
+        logger.info("%s: Batch analysis completed successfully", self.agent_name)
+        if not used_fallback:
+            cache_put(cache_key, validated)
+            semantic_put(semantic_namespace, semantic_text, validated)
+        return validated
+
+    def _build_prompt(
+        self,
+        patient_summary: str,
+        treatment_option: str,
+        simulation_horizon: int
+    ) -> str:
+        """Build analysis prompt (static scaffold plus small dynamic tail)."""
+        return "".join((
+            _PROMPT_SCAFFOLD,
+            "\nPATIENT SUMMARY:\n", patient_summary,
+            "\n\nTREATMENT OPTION:\n", treatment_option,
+            "\n\nSIMULATION HORIZON: ", str(simulation_horizon), " days\n"
+        ))
+
+    def _build_batch_prompt(
+        self,
+        patient_summary: str,
+        treatments: List[str],
+        simulation_horizon: int,
+        patient_cached: bool = False
+    ) -> str:
+        """Build batch analysis prompt (static scaffold plus dynamic tail)."""
+        treatment_lines = "\n".join(
+            f"{i}. {treatment}" for i, treatment in enumerate(treatments, start=1)
+        )
+        return "".join((
+            _BATCH_PROMPT_SCAFFOLD,
+            # When the patient summary lives in the per-request cache, omit
+            # it from the prompt - the cache already carries it
+            "" if patient_cached else f"\nPATIENT SUMMARY:\n{patient_summary}\n",
+            "\nTREATMENT OPTIONS:\n", treatment_lines,
+            "\n\nSIMULATION HORIZON: ", str(simulation_horizon), " days\n"
+        ))
+
+    def _create_fallback_response(self, treatment: str, error: bool = False) -> Dict[str, Any]:
+        """Create fallback response when Gemini fails."""
+        response = (_FALLBACK_ERROR_TEMPLATE if error else _FALLBACK_CAUTION_TEMPLATE).copy()
+        response["insights"] = response["insights"].format(treatment=treatment)
+        return response
@@ -0,0 +1,14 @@
+"""Utilities package"""
+from .json_guard import extract_json, safe_get
+from .response_cache import make_cache_key, cache_get, cache_put
+from .semantic_cache import semantic_get, semantic_put
+
+__all__ = [
+    "extract_json",
+    "safe_get",
+    "make_cache_key",
+    "cache_get",
+    "cache_put",
+    "semantic_get",
+    "semantic_put"
+]
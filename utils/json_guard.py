@@ -0,0 +1,84 @@
+"""
+JSON Extraction & Validation Guard
+"""
+import json
+import logging
+from typing import Any, Dict
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Repair-path decoder: raw_decode parses the first JSON document in a
+# string and tolerates trailing prose, which orjson rejects
+_DECODER = json.JSONDecoder()
+
+
+def extract_json(text: str) -> Dict[str, Any]:
+    """
+    Extract a JSON object from raw model output.
+
+    Handles markdown code fences and leading/trailing prose that
+    Gemini occasionally wraps around the JSON payload.
+
+    Args:
+        text: Raw text response from the model
+
+    Returns:
+        Parsed JSON dictionary, or an error dictionary if parsing fails
+    """
+    if not text:
+        return {"error": "Empty response from model"}
+
+    cleaned = text.strip()
+
+    # Strip markdown code fences (```json ... ```)
+    if cleaned.startswith("```"):
+        first_newline = cleaned.find("\n")
+        if first_newline != -1:
+            cleaned = cleaned[first_newline + 1:]
+        if cleaned.endswith("```"):
+            cleaned = cleaned[:-3]
+        cleaned = cleaned.strip()
+
+    # Fall back to the outermost braces if prose surrounds the JSON
+    if not cleaned.startswith("{"):
+        start = cleaned.find("{")
+        end = cleaned.rfind("}")
+        if start == -1 or end == -1 or end < start:
+            return {"error": "No JSON object found in response"}
+        cleaned = cleaned[start:end + 1]
+
+    try:
+        parsed = orjson.loads(cleaned)
+    except orjson.JSONDecodeError:
+        # The brace slice above can still capture trailing prose that
+        # happens to contain a "}"; raw_decode stops after the first
+        # complete object instead of requiring an exact document
+        try:
+            parsed, _ = _DECODER.raw_decode(cleaned)
+        except ValueError as e:
+            logger.warning("JSON parsing failed: %s", str(e))
+            return {"error": f"Invalid JSON in response: {str(e)}"}
+
+    if not isinstance(parsed, dict):
+        return {"error": "Response JSON is not an object"}
+
+    return parsed
+
+
+def safe_get(data: Any, key: str, default: Any = None) -> Any:
+    """
+    Safely get a key from a dictionary-like object.
+
+    Args:
+        data: Object to read from (expected dict)
+        key: Key to look up
+        default: Value returned when key is missing or data is not a dict
+
+    Returns:
+        The value for key, or default
+    """
+    if isinstance(data, dict):
+        return data.get(key, default)
+    return default
@@ -0,0 +1,108 @@
+"""
+In-Process Agent Response Cache
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+logger = logging.getLogger(__name__)
+
+CACHE_MAXSIZE = 1024
+CACHE_TTL_SECONDS = 3600
+
+# Shared across all agents; keys embed the agent name so entries never collide
+_cache: TTLCache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL_SECONDS)
+
+# In-flight calls keyed like the cache. The TTL cache only helps once the
+# first call has completed; this covers the window before that, letting
+# concurrent identical calls share one Gemini round-trip
+_inflight: Dict[str, asyncio.Future] = {}
+
+
+def make_cache_key(agent_name: str, *fields: Any) -> str:
+    """
+    Build a stable digest key from the agent name and its analysis inputs.
+
+    Args:
+        agent_name: Name of the agent producing the response
+        fields: Input fields the response is a pure function of
+
+    Returns:
+        Hex digest usable as a cache key
+    """
+    digest = hashlib.blake2b(agent_name.encode("utf-8"), digest_size=16)
+    for field in fields:
+        digest.update(b"|")
+        digest.update(str(field).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cache_get(key: str) -> Optional[Any]:
+    """
+    Look up a cached response.
+
+    Args:
+        key: Key from make_cache_key
+
+    Returns:
+        Cached response, or None on miss/expiry
+    """
+    value = _cache.get(key)
+    if value is not None:
+        logger.info("Response cache HIT (%s…) - Gemini call and tokens saved", key[:8])
+    else:
+        logger.debug("Response cache MISS (%s…)", key[:8])
+    return value
+
+
+async def coalesce(key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run factory() once per key; concurrent callers share its result.
+
+    The first caller for a key performs the call; callers arriving while
+    it is still in flight await the same future instead of issuing a
+    duplicate request. Failures propagate to every waiter.
+
+    Args:
+        key: Key from make_cache_key
+        factory: Zero-argument callable returning the awaitable to run
+
+    Returns:
+        The factory result, shared across coalesced callers
+    """
+    existing = _inflight.get(key)
+    if existing is not None:
+        logger.info("Coalesced duplicate in-flight call (%s…)", key[:8])
+        return await existing
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await factory()
+    except BaseException as e:
+        future.set_exception(e)
+        # Mark retrieved so futures with no waiters don't log on GC
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        del _inflight[key]
+
+
+def cache_put(key: str, value: Any) -> None:
+    """
+    Store a validated response.
+
+    Only validated, non-error responses should be cached; callers are
+    responsible for skipping fallback and error payloads.
+
+    Args:
+        key: Key from make_cache_key
+        value: Validated agent response
+    """
+    _cache[key] = value
@@ -0,0 +1,120 @@
+"""
+Optional Semantic Response Cache
+
+Catches near-duplicate inputs (e.g. two patients with identical comorbidity
+lists phrased differently) that the exact response cache misses, by comparing
+sentence embeddings with a conservative cosine-similarity threshold.
+
+Disabled unless SEMANTIC_CACHE_ENABLED=1 and sentence-transformers is
+installed; all lookups degrade to a no-op otherwise.
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_TTL_SECONDS = 86400  # 24h
+# Conservative threshold for medical safety: only near-identical inputs hit
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", DEFAULT_SIMILARITY_THRESHOLD))
+_model = None
+
+# Per-agent entries: list of {"embedding": ndarray, "response": Any, "timestamp": float}
+_entries: Dict[str, List[Dict[str, Any]]] = {}
+
+
+def _get_model():
+    """Lazily load the embedding model; disable the cache if unavailable."""
+    global _model, _enabled
+    if not _enabled:
+        return None
+    if _model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            logger.warning(
+                "SEMANTIC_CACHE_ENABLED is set but sentence-transformers is "
+                "not installed; semantic cache disabled"
+            )
+            _enabled = False
+            return None
+        _model = SentenceTransformer(EMBEDDING_MODEL)
+        logger.info("Semantic cache ready (model=%s, threshold=%s)", EMBEDDING_MODEL, _threshold)
+    return _model
+
+
+def _embed(text: str) -> np.ndarray:
+    """Embed text as a unit vector so dot product equals cosine similarity."""
+    model = _get_model()
+    vector = model.encode(text)
+    return np.asarray(vector) / np.linalg.norm(vector)
+
+
+def _prune(entries: List[Dict[str, Any]]) -> None:
+    """Drop entries older than the TTL in place."""
+    cutoff = time.time() - SEMANTIC_CACHE_TTL_SECONDS
+    entries[:] = [entry for entry in entries if entry["timestamp"] >= cutoff]
+
+
+def semantic_get(agent_name: str, text: str) -> Optional[Any]:
+    """
+    Look up a semantically equivalent cached response.
+
+    Args:
+        agent_name: Name of the agent producing the response
+        text: Input text the response is a function of
+
+    Returns:
+        Cached response if a stored input is similar enough, else None
+    """
+    if _get_model() is None:
+        return None
+
+    entries = _entries.get(agent_name)
+    if not entries:
+        return None
+    _prune(entries)
+    if not entries:
+        return None
+
+    query = _embed(text)
+    similarities = np.array([entry["embedding"] @ query for entry in entries])
+    best = int(np.argmax(similarities))
+    best_score = float(similarities[best])
+
+    # Logged to allow tuning the threshold against real traffic
+    logger.info("Semantic cache best similarity for %s: %.4f", agent_name, best_score)
+
+    if best_score >= _threshold:
+        logger.info("Semantic cache HIT for %s - Gemini call and tokens saved", agent_name)
+        return entries[best]["response"]
+    return None
+
+
+def semantic_put(agent_name: str, text: str, response: Any) -> None:
+    """
+    Store a validated response under its input's embedding.
+
+    Only validated, non-error responses should be stored so a bad payload
+    can never poison semantically similar lookups.
+
+    Args:
+        agent_name: Name of the agent producing the response
+        text: Input text the response is a function of
+        response: Validated agent response
+    """
+    if _get_model() is None:
+        return
+
+    _entries.setdefault(agent_name, []).append({
+        "embedding": _embed(text),
+        "response": response,
+        "timestamp": time.time()
+    })